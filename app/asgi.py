@@ -0,0 +1,110 @@
+import asyncio
+import falcon
+import falcon.asgi
+from metrics import wants_tracing
+from serializers import NDJSON_CONTENT_TYPE, loads, configure_media, wants_ndjson, aiter_ndjson
+from service import (
+    INDEX_HTML, INDEX_HTML_ETAG, HTTP_CACHE_MAX_AGE, STATIC_CACHE_MAX_AGE, REQUEST_ERRORS, GraphQLRequest, startup,
+    execute_async, format_error, get_health, get_stats, get_metrics, get_readiness, get_params_data
+)
+
+#ASGI variant of the app in main.py, sharing the same Query/Mutation schema. Run it with an ASGI server, e.g.
+#uvicorn asgi:app --app-dir app
+
+app = falcon.asgi.App(cors_enable=True)
+configure_media(app)
+
+startup()
+
+
+#Class for rendering the home page
+class HomePageResource:
+
+    async def on_get(self, req, resp):
+        resp.etag = INDEX_HTML_ETAG
+        resp.cache_control = ['public', 'max-age={0}'.format(STATIC_CACHE_MAX_AGE)]
+        if INDEX_HTML_ETAG in (req.if_none_match or []):
+            resp.status = falcon.HTTP_304
+            return
+        resp.content_type = 'text/html'
+        resp.text = INDEX_HTML
+        resp.status = falcon.HTTP_200
+
+#Class for reporting the health of the shared MongoDB connection pool
+class HealthResource:
+
+    async def on_get(self, req, resp):
+        resp.status, resp.media = await asyncio.get_running_loop().run_in_executor(None, get_health)
+
+#Class for reporting whether the process finished warming up and is ready to serve traffic
+class ReadyResource:
+
+    async def on_get(self, req, resp):
+        resp.status, resp.media = await asyncio.get_running_loop().run_in_executor(None, get_readiness)
+
+#Class for reporting the hit/miss/eviction counters of the in-process caches
+class StatsResource:
+
+    async def on_get(self, req, resp):
+        resp.media = get_stats()
+        resp.status = falcon.HTTP_200
+
+#Class for exposing the latency histograms and the MongoDB and cache counters in the Prometheus text format
+class MetricsResource:
+
+    async def on_get(self, req, resp):
+        resp.content_type = 'text/plain; version=0.0.4'
+        resp.text = get_metrics()
+        resp.status = falcon.HTTP_200
+
+# It takes a POST request with a JSON body containing a GraphQL query and variables, executes the query without
+# blocking the event loop, and returns the result as JSON. Query operations can also be sent over GET, where the
+# response carries an ETag and can be cached by HTTP caches.
+class GraphQLResource:
+
+    async def on_post(self, req, resp):
+        try:
+            data = loads(await req.bounded_stream.read())
+            resp.status, result = await execute_async(data, wants_tracing(req))
+            self.write_result(req, resp, result)
+        except REQUEST_ERRORS as ex:
+            resp.status, resp.media = format_error(ex)
+
+    async def on_get(self, req, resp):
+        try:
+            request = GraphQLRequest(get_params_data(req.params))
+            if not request.errors and not request.is_query:
+                resp.status = falcon.HTTP_405
+                resp.set_header('Allow', 'POST')
+                resp.media = {"errors": [{"message": "Only query operations can be sent over GET"}]}
+                return
+            # JSON and NDJSON responses of the same query are different representations, cached apart
+            etag = request.etag(wants_ndjson(req))
+            resp.vary = ['Accept']
+            if etag in (req.if_none_match or []):
+                resp.etag = etag
+                resp.status = falcon.HTTP_304
+                return
+            tracing = wants_tracing(req)
+            resp.status, result = await execute_async(request, tracing)
+            if "errors" not in (result or {}) and not tracing:
+                resp.etag = etag
+                resp.cache_control = ['public', 'max-age={0}'.format(HTTP_CACHE_MAX_AGE)]
+            self.write_result(req, resp, result)
+        except REQUEST_ERRORS as ex:
+            resp.status, resp.media = format_error(ex)
+
+    def write_result(self, req, resp, result):
+        if wants_ndjson(req) and "errors" not in (result or {}):
+            resp.content_type = NDJSON_CONTENT_TYPE
+            resp.stream = aiter_ndjson(result)
+        else:
+            resp.media = result
+            resp.content_type = 'application/json'
+
+app.add_route("/", HomePageResource())
+app.add_route("/graphql", GraphQLResource())
+app.add_route("/health", HealthResource())
+app.add_route("/ready", ReadyResource())
+app.add_route("/stats", StatsResource())
+app.add_route("/metrics", MetricsResource())
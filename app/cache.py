@@ -0,0 +1,230 @@
+import os
+import json
+import math
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COUNTRY_CACHE_TTL = float(os.getenv('COUNTRY_CACHE_TTL', 300))
+COUNTRY_CACHE_MAXSIZE = int(os.getenv('COUNTRY_CACHE_MAXSIZE', 1000))
+
+_MISSING = object()
+
+
+# The TTLCache class is a thread-safe LRU mapping whose entries also expire after a fixed number of seconds. It keeps
+# hit, miss and eviction counters so the effectiveness of the cache can be monitored.
+class TTLCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        It returns the cached value for the key, or the default when the key is missing or expired
+        """
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        It stores the value and evicts the least recently used entries once the cache is full
+        """
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        It returns the counters of the cache
+
+        :return: A dictionary with the hits, misses, evictions and current size, and a ttl of None when entries never
+        expire
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": None if self.ttl == math.inf else self.ttl,
+        }
+
+
+def row_digest(row):
+    """
+    It hashes a decoded country into a 64 bit integer that only depends on its content
+    """
+    encoded = json.dumps(row, sort_keys=True, default=str).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), 'big')
+
+
+# The CountryCache class holds the decoded country rows keyed by id, plus a snapshot of the full country list. Both are
+# filled on read through the loader functions given by the caller and kept consistent by refresh on writes. It also
+# keeps the dataset version, which HTTP responses use to build their ETags. The version is the XOR of the digests of
+# every country, so it only depends on the data: it is the same on every host, process and restart serving the same
+# countries, a reload finding the same data keeps it, and a write only rehashes the country it changed.
+class CountryCache:
+    SNAPSHOT_KEY = "all"
+
+    def __init__(self, maxsize=COUNTRY_CACHE_MAXSIZE, ttl=COUNTRY_CACHE_TTL):
+        self.rows = TTLCache(maxsize, ttl)
+        self.snapshot = TTLCache(1, ttl)
+        # Only one request reloads the snapshot, the others wait for its result
+        self._load_lock = threading.Lock()
+        # Guards the snapshot updates of refresh and the rows refreshed while the snapshot is being reloaded
+        self._lock = threading.Lock()
+        self._pending = None
+        self._digests = {}
+        self._digest = 0
+        self.version = self._format_version()
+
+    def _format_version(self):
+        return "{0:016x}-{1}".format(self._digest, len(self._digests))
+
+    def reset_version(self, rows):
+        """
+        It computes the dataset version of a complete list of decoded countries
+        """
+        with self._lock:
+            self._reset_version(rows)
+
+    def _reset_version(self, rows):
+        # Called with self._lock held
+        self._digests = {row["id"]: row_digest(row) for row in rows}
+        self._digest = 0
+        for value in self._digests.values():
+            self._digest ^= value
+        self.version = self._format_version()
+
+    def _update_version(self, country_id, row=None):
+        # Called with self._lock held, row None removes the country
+        self._digest ^= self._digests.pop(country_id, 0)
+        if row is not None:
+            self._digests[country_id] = row_digest(row)
+            self._digest ^= self._digests[country_id]
+        self.version = self._format_version()
+
+    @property
+    def enabled(self):
+        return self.rows.maxsize > 0 and self.rows.ttl > 0
+
+    def get_many(self, country_ids, loader):
+        """
+        It returns several decoded countries, calling the loader once with all the ids missing from the cache
+
+        :param country_ids: The ids of the countries
+        :param loader: A function taking a list of ids and returning a dictionary of id to decoded country
+        :return: A dictionary of id to decoded country, ids that do not exist are left out
+        """
+        rows, missing = {}, []
+        for country_id in country_ids:
+            row = self.rows.get(country_id)
+            if row is None:
+                missing.append(country_id)
+            else:
+                rows[country_id] = row
+        if missing:
+            for country_id, row in loader(missing).items():
+                self.rows.set(country_id, row)
+                rows[country_id] = row
+        return rows
+
+    def get_all(self, loader):
+        """
+        It returns the snapshot of all the decoded countries, calling the loader when the snapshot is missing or
+        expired
+
+        :param loader: A function returning the list of decoded countries
+        :return: A list of decoded countries
+        """
+        rows = self.snapshot.get(self.SNAPSHOT_KEY)
+        if rows is not None:
+            return rows
+        with self._load_lock:
+            rows = self.snapshot.get(self.SNAPSHOT_KEY)
+            if rows is not None:
+                return rows
+            with self._lock:
+                self._pending = {}
+            try:
+                rows = loader()
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                # Rows refreshed while the loader ran are newer than the ones it read
+                pending, self._pending = self._pending, None
+                rows = [pending.pop(row["id"], row) for row in rows] + list(pending.values())
+                self.snapshot.set(self.SNAPSHOT_KEY, rows)
+                for row in rows:
+                    self.rows.set(row["id"], row)
+                self._reset_version(rows)
+        return rows
+
+    def refresh(self, row):
+        """
+        It replaces a single decoded country after a write, in the by-id entries and in the snapshot
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending[row["id"]] = row
+            self._update_version(row["id"], row)
+            self.rows.set(row["id"], row)
+            rows = self.snapshot.get(self.SNAPSHOT_KEY)
+            if rows is not None:
+                rows = [row if item["id"] == row["id"] else item for item in rows]
+                self.snapshot.set(self.SNAPSHOT_KEY, rows)
+
+    def invalidate(self, country_id=None):
+        """
+        It drops a single country, or everything when no id is given, so that the next read goes to the database
+        """
+        with self._lock:
+            if country_id is None:
+                self._reset_version([])
+            else:
+                self._update_version(country_id)
+        if country_id is None:
+            self.rows.clear()
+        else:
+            self.rows.delete(country_id)
+        self.snapshot.clear()
+
+    def stats(self):
+        return {"rows": self.rows.stats(), "snapshot": self.snapshot.stats()}
+
+
+country_cache = CountryCache()
@@ -0,0 +1,219 @@
+import os
+import json
+import math
+from graphql import (
+    GraphQLError, FieldNode, FragmentSpreadNode, InlineFragmentNode, FragmentDefinitionNode, get_named_type,
+    get_operation_ast
+)
+from graphql.validation import ValidationRule
+from graphql.execution.values import get_argument_values, get_variable_values
+from utils import MAX_PAGE_SIZE
+from metrics import rejected_operations
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_QUERY_COST = int(os.getenv('MAX_QUERY_COST', 300))
+MAX_QUERY_DEPTH = int(os.getenv('MAX_QUERY_DEPTH', 10))
+MAX_QUERY_ALIASES = int(os.getenv('MAX_QUERY_ALIASES', 15))
+# Every started block of this many rows read by a list field multiplies the cost of the field once more
+COST_ROWS_PER_UNIT = int(os.getenv('COST_ROWS_PER_UNIT', 10))
+# Result rows of countriesNearbyBatchQuery, i.e. points times k, per cost unit. The distances of a whole batch are
+# computed in one vectorized pass, so these rows are much cheaper than rows read from the database; with the defaults
+# a batch of MAX_NEARBY_BATCH_POINTS with the default k of 10 costs 250, while a larger k shrinks the batches allowed.
+NEARBY_ROWS_PER_UNIT = int(os.getenv('NEARBY_ROWS_PER_UNIT', 2000))
+# Rows assumed for a countriesQuery without page and limit, which returns the whole collection
+ESTIMATED_COUNTRY_COUNT = int(os.getenv('ESTIMATED_COUNTRY_COUNT', 250))
+
+# Cost of one execution of a field, fields that are not listed only read a key of an already fetched row and are free.
+# FIELD_COSTS in the environment overrides single entries, e.g. FIELD_COSTS='{"Query.countriesNearbyQuery": 20}'
+FIELD_COSTS = {
+    "Query.countryQuery": 1,
+    "Query.countriesByIdsQuery": 1,
+    "Query.countriesQuery": 2,
+    "Query.countriesConnectionQuery": 2,
+    "Query.countriesByLanguageQuery": 5,
+    "Query.countriesNearbyQuery": 5,
+    "Query.countriesNearbyBatchQuery": 5,
+    "Query.continentStatsQuery": 1,
+    "Query.languageStatsQuery": 1,
+    "Mutation.countryEditMutation": 10,
+    "Mutation.countriesBulkEditMutation": 2,
+}
+FIELD_COSTS.update(json.loads(os.getenv('FIELD_COSTS', '{}')))
+
+def _nearby_rows(args):
+    # The nearby fields return k countries per point, and never more than there are countries
+    return min(args.get("k") or 0, ESTIMATED_COUNTRY_COUNT)
+
+
+# Number of rows read by the list fields, computed from their arguments
+ROW_ESTIMATES = {
+    "Query.countriesQuery":
+        lambda args: args["limit"] if args.get("page") and args.get("limit") else ESTIMATED_COUNTRY_COUNT,
+    "Query.countriesConnectionQuery": lambda args: min(args.get("first") or MAX_PAGE_SIZE, MAX_PAGE_SIZE),
+    "Query.countriesByIdsQuery": lambda args: len(args.get("ids") or []),
+    "Query.countriesNearbyQuery": lambda args: _nearby_rows(args),
+    "Query.countriesNearbyBatchQuery": lambda args: len(args.get("points") or []) * _nearby_rows(args),
+    "Mutation.countriesBulkEditMutation": lambda args: len(args.get("edits") or []),
+}
+# Rows per cost unit of the list fields that do not use COST_ROWS_PER_UNIT
+ROWS_PER_UNIT = {
+    "Query.countriesNearbyBatchQuery": NEARBY_ROWS_PER_UNIT,
+}
+
+
+def reject(reason, message, **extensions):
+    """
+    It counts a rejected operation and builds the error returned to the client
+
+    :param reason: The limit that was exceeded, used as the label of the counter and as the error code
+    :param message: The error message
+    :return: A GraphQLError
+    """
+    rejected_operations.inc(reason)
+    extensions["code"] = "{0}_LIMIT_EXCEEDED".format(reason.upper())
+    return GraphQLError(message, extensions=extensions)
+
+
+def _is_introspection(node):
+    return isinstance(node, FieldNode) and node.name.value.startswith("__")
+
+
+def _selection_depth(selection_set, get_fragment, visited=frozenset()):
+    """
+    It returns the number of nested field levels of a selection set, following fragments
+    """
+    depth = 0
+    for node in selection_set.selections:
+        if _is_introspection(node):
+            continue
+        if isinstance(node, FieldNode):
+            depth = max(depth, 1 + (_selection_depth(node.selection_set, get_fragment, visited)
+                                    if node.selection_set else 0))
+        elif isinstance(node, InlineFragmentNode):
+            depth = max(depth, _selection_depth(node.selection_set, get_fragment, visited))
+        elif isinstance(node, FragmentSpreadNode) and node.name.value not in visited:
+            fragment = get_fragment(node.name.value)
+            if fragment is not None:
+                depth = max(depth, _selection_depth(fragment.selection_set, get_fragment, visited | {node.name.value}))
+    return depth
+
+
+def _alias_count(selection_set, get_fragment, visited=frozenset()):
+    """
+    It returns the number of aliased fields of a selection set, counting a fragment once per spread
+    """
+    count = 0
+    for node in selection_set.selections:
+        if isinstance(node, FieldNode):
+            count += 1 if node.alias else 0
+            if node.selection_set:
+                count += _alias_count(node.selection_set, get_fragment, visited)
+        elif isinstance(node, InlineFragmentNode):
+            count += _alias_count(node.selection_set, get_fragment, visited)
+        elif isinstance(node, FragmentSpreadNode) and node.name.value not in visited:
+            fragment = get_fragment(node.name.value)
+            if fragment is not None:
+                count += _alias_count(fragment.selection_set, get_fragment, visited | {node.name.value})
+    return count
+
+
+# The DepthLimitRule class is a validation rule rejecting operations nested deeper than MAX_QUERY_DEPTH fields.
+class DepthLimitRule(ValidationRule):
+    def enter_operation_definition(self, node, *_args):
+        depth = _selection_depth(node.selection_set, self.context.get_fragment)
+        if depth > MAX_QUERY_DEPTH:
+            self.report_error(reject(
+                "depth", "Query depth {0} exceeds the maximum depth of {1}".format(depth, MAX_QUERY_DEPTH),
+                depth=depth, maxDepth=MAX_QUERY_DEPTH))
+
+
+# The AliasLimitRule class is a validation rule rejecting operations with more than MAX_QUERY_ALIASES aliased fields,
+# which is how one request repeats an expensive field.
+class AliasLimitRule(ValidationRule):
+    def enter_operation_definition(self, node, *_args):
+        aliases = _alias_count(node.selection_set, self.context.get_fragment)
+        if aliases > MAX_QUERY_ALIASES:
+            self.report_error(reject(
+                "aliases", "Query uses {0} aliases, more than the maximum of {1}".format(aliases, MAX_QUERY_ALIASES),
+                aliases=aliases, maxAliases=MAX_QUERY_ALIASES))
+
+
+LIMIT_RULES = [DepthLimitRule, AliasLimitRule]
+
+
+def _selection_cost(schema, parent_type, selection_set, fragments, variables, visited=frozenset()):
+    """
+    It returns the cost of a selection set: the weight of each field plus the cost of its own selections, multiplied
+    by the number of row blocks the field reads
+    """
+    cost = 0
+    for node in selection_set.selections:
+        if _is_introspection(node):
+            continue
+        if isinstance(node, FieldNode):
+            field = parent_type.fields.get(node.name.value)
+            if field is None:
+                continue
+            key = "{0}.{1}".format(parent_type.name, node.name.value)
+            multiplier = 1
+            if key in ROW_ESTIMATES:
+                try:
+                    rows = ROW_ESTIMATES[key](get_argument_values(field, node, variables))
+                except Exception:
+                    rows = 0
+                multiplier = max(1, math.ceil(rows / ROWS_PER_UNIT.get(key, COST_ROWS_PER_UNIT)))
+            nested = 0
+            if node.selection_set:
+                nested = _selection_cost(
+                    schema, get_named_type(field.type), node.selection_set, fragments, variables, visited)
+            cost += (FIELD_COSTS.get(key, 0) + nested) * multiplier
+        elif isinstance(node, InlineFragmentNode):
+            fragment_type = schema.get_type(node.type_condition.name.value) if node.type_condition else parent_type
+            cost += _selection_cost(schema, fragment_type, node.selection_set, fragments, variables, visited)
+        elif isinstance(node, FragmentSpreadNode) and node.name.value not in visited:
+            fragment = fragments.get(node.name.value)
+            if fragment is not None:
+                cost += _selection_cost(
+                    schema, schema.get_type(fragment.type_condition.name.value), fragment.selection_set, fragments,
+                    variables, visited | {node.name.value})
+    return cost
+
+
+def operation_cost(schema, document, operation_name=None, variables=None):
+    """
+    It computes the static cost of the operation that would be executed, using the variables of the request to size
+    the list fields
+
+    :param schema: The GraphQLSchema
+    :param document: The parsed and validated document
+    :param operation_name: The name of the operation to execute
+    :param variables: The raw variables of the request
+    :return: The cost, or 0 when the operation or its variables are invalid and execution will report it
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return 0
+    root_type = schema.get_root_type(operation.operation)
+    values = get_variable_values(schema, operation.variable_definitions or [], variables or {})
+    if root_type is None or isinstance(values, list):
+        return 0
+    fragments = {
+        definition.name.value: definition for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    return _selection_cost(schema, root_type, operation.selection_set, fragments, values)
+
+
+def check_cost(schema, document, operation_name=None, variables=None):
+    """
+    It rejects operations costing more than MAX_QUERY_COST before they are executed
+
+    :return: A list of errors, empty when the operation is allowed
+    """
+    cost = operation_cost(schema, document, operation_name, variables)
+    if cost > MAX_QUERY_COST:
+        return [reject("cost", "Query cost {0} exceeds the maximum cost of {1}".format(cost, MAX_QUERY_COST),
+                       cost=cost, maxCost=MAX_QUERY_COST)]
+    return []
@@ -1,4 +1,5 @@
 import graphene
+from graphene.relay import PageInfo
 
 
 # The above code defines a custom scalar for dictionaries in Python using the graphene library.
@@ -6,7 +7,8 @@ class CustomDictionary(graphene.Scalar):
     # Define custom scalar for dictionaries
     pass
 
-# This is a GraphQL object type representing a country with various fields and corresponding resolver functions.
+# This is a GraphQL object type representing a country. Resolvers return the decoded country dictionaries directly and
+# the fields are read by graphene's default dictionary/attribute resolver.
 
 class CountryType(graphene.ObjectType):
     id = graphene.String()
@@ -24,53 +26,52 @@ class CountryType(graphene.ObjectType):
     timezones = graphene.List(graphene.String)
     continents = graphene.List(graphene.String)
 
-    def resolve_id(self, info):
-        return self.id
 
-    def resolve_name(self, info):
-        return self.name
-
-    def resolve_independent(self, info):
-        return self.independent
-
-    def resolve_status(self, info):
-        return self.status
+# The NearestCountryType class extends the CountryType class and adds the distance to the point of interest.
+class NearestCountryType(CountryType):
+    distance = graphene.Float()
 
-    def resolve_unMember(self, info):
-        return self.unMember
 
-    def resolve_currencies(self, info):
-        return self.currencies
+# This is a GraphQL input type representing a point on the map.
+class LatLngInput(graphene.InputObjectType):
+    lat = graphene.Float(required=True)
+    lng = graphene.Float(required=True)
 
-    def resolve_capital(self, info):
-        return self.capital
 
-    def resolve_languages(self, info):
-        return self.languages
+# This is a GraphQL object type holding the countries nearest to one of the points of a batch query.
+class NearbyCountriesType(graphene.ObjectType):
+    lat = graphene.Float()
+    lng = graphene.Float()
+    countries = graphene.List(NearestCountryType)
 
-    def resolve_latlng(self, info):
-        return self.latlng
 
-    def resolve_flag(self, info):
-        return self.flag
+# The CountrySortField enum lists the orders countriesConnectionQuery can page through, with the Mongo path of each.
+class CountrySortField(graphene.Enum):
+    ID = "_id"
+    NAME = "name.common"
+    POPULATION = "population"
 
-    def resolve_population(self, info):
-        return self.population
 
-    def resolve_timezones(self, info):
-        return self.timezones
+# This is a GraphQL object type holding the summary of the countries of one continent or language.
+class CountryStatsType(graphene.ObjectType):
+    name = graphene.String()
+    count = graphene.Int()
+    totalPopulation = graphene.BigInt()
+    averagePopulation = graphene.Float()
+    unMemberCount = graphene.Int()
 
-    def resolve_continents(self, info):
-        return self.continents
 
+# This is a Relay-style edge holding a country and the cursor pointing right after it.
+class CountryEdgeType(graphene.ObjectType):
+    cursor = graphene.String()
+    node = graphene.Field(CountryType)
 
-# The NearestCountryType class extends the CountryType class and adds a distance attribute that can be resolved to return
-# the distance value.
-class NearestCountryType(CountryType):
-    distance = graphene.Float()
 
-    def resolve_distance(self, info):
-        return self.distance
+# This is a Relay-style connection over a page of countries.
+class CountryConnectionType(graphene.ObjectType):
+    edges = graphene.List(CountryEdgeType)
+    pageInfo = graphene.Field(PageInfo)
+    totalCount = graphene.Int()
 
 
 # This is a GraphQL object type representing various properties of a country.
@@ -89,3 +90,34 @@ class CountryOutputType(graphene.ObjectType):
     population = graphene.Int()
     timezones = graphene.List(graphene.String)
     continents = graphene.List(graphene.String)
+
+
+# This is a GraphQL input type holding the fields of a country to change, fields that are left out are not written.
+class CountryPatchInput(graphene.InputObjectType):
+    name = graphene.JSONString()
+    independent = graphene.Boolean()
+    status = graphene.Boolean()
+    unMember = graphene.Boolean()
+    currencies = graphene.JSONString()
+    capital = graphene.List(graphene.String)
+    languages = graphene.List(graphene.String)
+    latlng = graphene.List(graphene.Float)
+    flag = graphene.String()
+    maps = graphene.JSONString()
+    population = graphene.Int()
+    timezones = graphene.List(graphene.String)
+    continents = graphene.List(graphene.String)
+
+
+# This is a GraphQL input type representing the edit of one country in a bulk edit.
+class CountryEditInput(graphene.InputObjectType):
+    id = graphene.ID(required=True)
+    patch = graphene.Field(CountryPatchInput, required=True)
+
+
+# This is a GraphQL object type reporting the outcome of the edit of one country in a bulk edit.
+class CountryEditResultType(graphene.ObjectType):
+    id = graphene.ID()
+    ok = graphene.Boolean()
+    error = graphene.String()
+    country = graphene.Field(CountryOutputType)
@@ -0,0 +1,280 @@
+import bisect
+import threading
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+# Upper bound of the number of cells in one points x countries distance matrix, larger batches are split in chunks
+DISTANCE_MATRIX_CELLS = 4_000_000
+
+
+def haversine(lat_rad, lng_rad, cos_lat, input_lat, input_lng):
+    """
+    It calculates the haversine distance between many points and one or many input coordinates in a single vectorized
+    pass. Passing column vectors of input coordinates gives a (inputs x points) matrix through broadcasting.
+
+    :param lat_rad: latitudes of the points, in radians
+    :param lng_rad: longitudes of the points, in radians
+    :param cos_lat: cosines of the latitudes of the points
+    :param input_lat: latitude(s) of the input location, in degrees
+    :param input_lng: longitude(s) of the input location, in degrees
+    :return: A NumPy array of distances in kilometers
+    """
+    input_lat = np.radians(input_lat)
+    input_lng = np.radians(input_lng)
+    a = np.sin((lat_rad - input_lat) / 2) ** 2 + np.cos(input_lat) * cos_lat * np.sin((lng_rad - input_lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_positions(distances, k, max_distance_km=None):
+    """
+    It selects the positions of the k smallest distances, sorted, without sorting the whole array
+
+    :param distances: A one dimensional NumPy array of distances
+    :param k: The maximum number of positions to return
+    :param max_distance_km: Optional radius in kilometers, further positions are dropped
+    :return: A NumPy array of positions
+    """
+    if k < len(distances):
+        positions = np.argpartition(distances, k)[:k]
+    else:
+        positions = np.arange(len(distances))
+    positions = positions[np.argsort(distances[positions], kind='stable')]
+    if max_distance_km is not None:
+        positions = positions[distances[positions] <= max_distance_km]
+    return positions
+
+
+# The SpatialIndex class keeps the coordinates of the countries in contiguous NumPy arrays, so the distances to every
+# country are computed in one vectorized pass and the k nearest are picked with a partial sort. At the size of the
+# country dataset this is faster than walking a tree in Python.
+class SpatialIndex:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._arrays = ([], np.empty(0), np.empty(0), np.empty(0))
+        self.loaded = False
+
+    def build(self, items):
+        """
+        It replaces the content of the index with the given items
+
+        :param items: An iterable of (key, lat, lng, value) tuples
+        """
+        entries = {key: (lat, lng, value) for key, lat, lng, value in items}
+        with self._lock:
+            self._entries = entries
+            self._publish()
+            self.loaded = True
+
+    def update(self, key, lat, lng, value):
+        """
+        It inserts or replaces a single item. Writes are rare, so the arrays are simply rebuilt.
+        """
+        with self._lock:
+            self._entries[key] = (lat, lng, value)
+            self._publish()
+
+    def remove(self, key):
+        """
+        It removes a single item from the index if it is present
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._publish()
+
+    def _publish(self):
+        # Readers take the arrays as one tuple, so they never see the values and the coordinates out of step
+        entries = list(self._entries.values())
+        lat_rad = np.radians(np.array([entry[0] for entry in entries], dtype=np.float64))
+        lng_rad = np.radians(np.array([entry[1] for entry in entries], dtype=np.float64))
+        self._arrays = ([entry[2] for entry in entries], lat_rad, lng_rad, np.cos(lat_rad))
+
+    def nearest(self, lat, lng, k=10, max_distance_km=None):
+        """
+        It finds the k items closest to the given coordinates
+
+        :param lat: latitude of the point of interest
+        :param lng: longitude of the point of interest
+        :param k: The maximum number of items to return
+        :param max_distance_km: Optional radius in kilometers, items further away are ignored
+        :return: A list of (distance_km, value) tuples sorted by distance.
+        """
+        values, lat_rad, lng_rad, cos_lat = self._arrays
+        if not values or k <= 0:
+            return []
+        distances = haversine(lat_rad, lng_rad, cos_lat, lat, lng)
+        return [(float(distances[i]), values[i]) for i in nearest_positions(distances, k, max_distance_km)]
+
+    def nearest_many(self, points, k=10, max_distance_km=None):
+        """
+        It finds the k items closest to each of the given coordinates, computing a points x items distance matrix
+
+        :param points: A list of (lat, lng) tuples
+        :param k: The maximum number of items to return per point
+        :param max_distance_km: Optional radius in kilometers, items further away are ignored
+        :return: A list holding, for each point, a list of (distance_km, value) tuples sorted by distance.
+        """
+        values, lat_rad, lng_rad, cos_lat = self._arrays
+        if not values or k <= 0:
+            return [[] for _ in points]
+        coordinates = np.array(points, dtype=np.float64).reshape(-1, 2)
+        chunk = max(1, DISTANCE_MATRIX_CELLS // len(values))
+        results = []
+        for start in range(0, len(coordinates), chunk):
+            block = coordinates[start:start + chunk]
+            matrix = haversine(lat_rad, lng_rad, cos_lat, block[:, :1], block[:, 1:])
+            for distances in matrix:
+                results.append(
+                    [(float(distances[i]), values[i]) for i in nearest_positions(distances, k, max_distance_km)])
+        return results
+
+
+# The LanguageIndex class is an inverted index from lower-cased language names to the countries that speak them. The
+# language names are also kept sorted, so that prefix matches are a range scan instead of a full scan.
+class LanguageIndex:
+    def __init__(self):
+        self._languages = {}
+        self._country_languages = {}
+        self._sorted_languages = []
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def build(self, items):
+        """
+        It replaces the content of the index with the given items
+
+        :param items: An iterable of (key, languages, value) tuples
+        """
+        with self._lock:
+            self._languages = {}
+            self._country_languages = {}
+            for key, languages, value in items:
+                self._add(key, languages, value)
+            self._sorted_languages = sorted(self._languages)
+            self.loaded = True
+
+    def update(self, key, languages, value):
+        """
+        It inserts or replaces the languages of a single item
+        """
+        with self._lock:
+            self._remove(key)
+            self._add(key, languages, value)
+            self._sorted_languages = sorted(self._languages)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+            self._sorted_languages = sorted(self._languages)
+
+    def _add(self, key, languages, value):
+        names = {language.lower() for language in languages}
+        self._country_languages[key] = names
+        for name in names:
+            self._languages.setdefault(name, {})[key] = value
+
+    def _remove(self, key):
+        for name in self._country_languages.pop(key, ()):
+            entries = self._languages.get(name)
+            if entries is not None:
+                entries.pop(key, None)
+                if not entries:
+                    del self._languages[name]
+
+    def lookup(self, language, prefix=False):
+        """
+        It finds the items that speak the given language, ignoring case
+
+        :param language: The language, or the beginning of the language name when prefix is set
+        :param prefix: Match every language starting with the given text
+        :return: A list of values without duplicates
+        """
+        name = language.lower()
+        if not prefix:
+            return list(self._languages.get(name, {}).values())
+        sorted_languages = self._sorted_languages
+        matches = {}
+        position = bisect.bisect_left(sorted_languages, name)
+        while position < len(sorted_languages) and sorted_languages[position].startswith(name):
+            matches.update(self._languages.get(sorted_languages[position], {}))
+            position += 1
+        return list(matches.values())
+
+
+# The StatsIndex class is a materialized summary of the countries grouped by the values of a list field: the number of
+# countries, their total population and how many are UN members. The contribution of every country is kept, so a
+# write subtracts the old one and adds the new one instead of recomputing the groups.
+class StatsIndex:
+    def __init__(self):
+        self._groups = {}
+        self._contributions = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def build(self, items):
+        """
+        It replaces the content of the index with the given items
+
+        :param items: An iterable of (key, groups, population, un_member) tuples
+        """
+        with self._lock:
+            self._groups = {}
+            self._contributions = {}
+            for key, groups, population, un_member in items:
+                self._add(key, groups, population, un_member)
+            self.loaded = True
+
+    def update(self, key, groups, population, un_member):
+        """
+        It inserts or replaces the contribution of a single item
+        """
+        with self._lock:
+            self._remove(key)
+            self._add(key, groups, population, un_member)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _add(self, key, groups, population, un_member):
+        contribution = (tuple(set(groups or ())), population or 0, 1 if un_member else 0)
+        self._contributions[key] = contribution
+        for group in contribution[0]:
+            count, total, members = self._groups.get(group, (0, 0, 0))
+            self._groups[group] = (count + 1, total + contribution[1], members + contribution[2])
+
+    def _remove(self, key):
+        contribution = self._contributions.pop(key, None)
+        if contribution is None:
+            return
+        for group in contribution[0]:
+            count, total, members = self._groups[group]
+            if count == 1:
+                del self._groups[group]
+            else:
+                self._groups[group] = (count - 1, total - contribution[1], members - contribution[2])
+
+    def summaries(self, name=None):
+        """
+        It returns the summary of every group, sorted by group name
+
+        :param name: Only return the group with this name, ignoring case
+        :return: A list of dictionaries with the name, count, totalPopulation, averagePopulation and unMemberCount
+        """
+        with self._lock:
+            groups = sorted(self._groups.items())
+        if name is not None:
+            groups = [group for group in groups if group[0].lower() == name.lower()]
+        return [{
+            "name": group,
+            "count": count,
+            "totalPopulation": total,
+            "averagePopulation": total / count,
+            "unMemberCount": members,
+        } for group, (count, total, members) in groups]
+
+
+spatial_index = SpatialIndex()
+language_index = LanguageIndex()
+continent_stats = StatsIndex()
+language_stats = StatsIndex()
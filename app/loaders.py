@@ -0,0 +1,94 @@
+import threading
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from graphql.execution.values import get_argument_values
+from repository import country_repository
+from utils import get_projection
+
+# Top-level fields whose country ids are collected ahead of time, with the argument holding the id or list of ids
+BATCHED_FIELDS = {
+    "countryQuery": "id",
+    "countriesByIdsQuery": "ids",
+}
+
+
+def collect_country_ids(info):
+    """
+    It walks the top-level selections of the operation being executed and collects every country id requested
+    through the batched fields, resolving variables and fragments along the way
+
+    :param info: The GraphQLResolveInfo of one of the top-level fields
+    :return: A tuple of the list of country ids and the list of batched field nodes
+    """
+    ids, field_nodes = [], []
+    selections = list(info.operation.selection_set.selections)
+    while selections:
+        node = selections.pop()
+        if isinstance(node, FragmentSpreadNode):
+            fragment = info.fragments.get(node.name.value)
+            if fragment is not None:
+                selections.extend(fragment.selection_set.selections)
+        elif isinstance(node, InlineFragmentNode):
+            selections.extend(node.selection_set.selections)
+        elif isinstance(node, FieldNode) and node.name.value in BATCHED_FIELDS:
+            field = info.parent_type.fields.get(node.name.value)
+            if field is None:
+                continue
+            try:
+                value = get_argument_values(field, node, info.variable_values)[BATCHED_FIELDS[node.name.value]]
+            except Exception:
+                continue
+            ids.extend(value if isinstance(value, list) else [value])
+            field_nodes.append(node)
+    return ids, field_nodes
+
+
+# The CountryLoader class is a per-request DataLoader. On the first lookup it collects the ids of every countryQuery and
+# countriesByIdsQuery field in the operation and fetches the ones missing from the country cache with a single $in
+# query, so aliased lookups in one document cost one round trip.
+class CountryLoader:
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def load_many(self, country_ids, info=None):
+        """
+        It returns the decoded countries for the given ids, in the same order
+
+        :param country_ids: The ids of the countries
+        :param info: The GraphQLResolveInfo of the calling resolver, used to batch the other lookups of the operation
+        :return: A list of decoded countries, with None for ids that do not exist
+        """
+        country_ids = [str(country_id) for country_id in country_ids]
+        with self._lock:
+            missing = [country_id for country_id in country_ids if country_id not in self._rows]
+            if missing:
+                projection = None
+                if info is not None:
+                    batched_ids, field_nodes = collect_country_ids(info)
+                    missing.extend(
+                        str(country_id) for country_id in batched_ids if str(country_id) not in self._rows)
+                    projection = get_projection(info, field_nodes + list(info.field_nodes))
+                missing = list(dict.fromkeys(missing))
+                rows = country_repository.by_ids(missing, projection)
+                for country_id in missing:
+                    self._rows[country_id] = rows.get(country_id)
+        return [self._rows[country_id] for country_id in country_ids]
+
+    def load(self, country_id, info=None):
+        """
+        It returns the decoded country for the given id, or None if it does not exist
+        """
+        return self.load_many([country_id], info)[0]
+
+
+def get_country_loader(info):
+    """
+    It returns the CountryLoader of the current request, creating it if the request has none yet
+
+    :param info: The GraphQLResolveInfo of the calling resolver
+    :return: A CountryLoader
+    """
+    context = info.context
+    if not isinstance(context, dict):
+        return CountryLoader()
+    return context.setdefault("country_loader", CountryLoader())
@@ -1,11 +1,12 @@
 import os
 import falcon
 from falcon_cors import CORS
-import graphene
-from graphql import GraphQLError
-import json
-from queries import Query
-from mutations import Mutation
+from metrics import wants_tracing
+from serializers import NDJSON_CONTENT_TYPE, loads, configure_media, wants_ndjson, iter_ndjson
+from service import (
+    INDEX_HTML, INDEX_HTML_ETAG, HTTP_CACHE_MAX_AGE, STATIC_CACHE_MAX_AGE, REQUEST_ERRORS, GraphQLRequest,
+    startup, execute, format_error, get_health, get_stats, get_metrics, get_readiness, get_params_data
+)
 
 from dotenv import load_dotenv
 
@@ -16,53 +17,113 @@ cors = CORS(
     allow_all_headers=True,
     allow_all_methods=True
 )
-INDEX_HTML_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'static/html/index.html'))
-
 app = falcon.App(middleware=[cors.middleware])
+configure_media(app)
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+startup()
 
 
 #Class for rendering the home page
 class HomePageResource:
 
     def on_get(self, req, resp):
-        with open(INDEX_HTML_PATH, 'r') as f:
-            html = f.read()
+        resp.etag = INDEX_HTML_ETAG
+        resp.cache_control = ['public', 'max-age={0}'.format(STATIC_CACHE_MAX_AGE)]
+        if INDEX_HTML_ETAG in (req.if_none_match or []):
+            resp.status = falcon.HTTP_304
+            return
         resp.content_type = 'text/html'
-        resp.text = html
+        resp.text = INDEX_HTML
+        resp.status = falcon.HTTP_200
+
+#Class for reporting the health of the shared MongoDB connection pool
+class HealthResource:
+
+    def on_get(self, req, resp):
+        resp.status, resp.media = get_health()
+
+#Class for reporting whether the process finished warming up and is ready to serve traffic
+class ReadyResource:
+
+    def on_get(self, req, resp):
+        resp.status, resp.media = get_readiness()
+
+#Class for reporting the hit/miss/eviction counters of the in-process caches
+class StatsResource:
+
+    def on_get(self, req, resp):
+        resp.media = get_stats()
+        resp.status = falcon.HTTP_200
+
+#Class for exposing the latency histograms and the MongoDB and cache counters in the Prometheus text format
+class MetricsResource:
+
+    def on_get(self, req, resp):
+        resp.content_type = 'text/plain; version=0.0.4'
+        resp.text = get_metrics()
         resp.status = falcon.HTTP_200
 
-# It takes a POST request with a JSON body containing a GraphQL query and variables, executes the query, and returns the result as JSON
+# It takes a POST request with a JSON body containing a GraphQL query and variables, executes the query, and returns the result as JSON.
+# Query operations can also be sent over GET, where the response carries an ETag and can be cached by HTTP caches.
 class GraphQLResource:
 
     def on_post(self, req, resp):
         try:
-            data = json.loads(req.bounded_stream.read().decode('utf-8'))
-            action = data['query'] if 'query' in data else data['mutation']
-            result = schema.execute(action, variable_values=data.get('variables'))
-            resp.media = result.data
-        except (ValueError, KeyError, TypeError, GraphQLError, SyntaxError) as ex:
-            resp.media = {"errors": [{"message": str(ex)}]}
-            resp.status = falcon.HTTP_400
+            data = loads(req.bounded_stream.read())
+            resp.status, result = execute(data, wants_tracing(req))
+            self.write_result(req, resp, result)
+        except REQUEST_ERRORS as ex:
+            resp.status, resp.media = format_error(ex)
+
+    def on_get(self, req, resp):
+        try:
+            request = GraphQLRequest(get_params_data(req.params))
+            if not request.errors and not request.is_query:
+                resp.status = falcon.HTTP_405
+                resp.set_header('Allow', 'POST')
+                resp.media = {"errors": [{"message": "Only query operations can be sent over GET"}]}
+                return
+            # JSON and NDJSON responses of the same query are different representations, cached apart
+            etag = request.etag(wants_ndjson(req))
+            resp.vary = ['Accept']
+            if etag in (req.if_none_match or []):
+                resp.etag = etag
+                resp.status = falcon.HTTP_304
+                return
+            tracing = wants_tracing(req)
+            resp.status, result = execute(request, tracing)
+            if "errors" not in (result or {}) and not tracing:
+                resp.etag = etag
+                resp.cache_control = ['public', 'max-age={0}'.format(HTTP_CACHE_MAX_AGE)]
+            self.write_result(req, resp, result)
+        except REQUEST_ERRORS as ex:
+            resp.status, resp.media = format_error(ex)
+
+    def write_result(self, req, resp, result):
+        if wants_ndjson(req) and "errors" not in (result or {}):
+            resp.content_type = NDJSON_CONTENT_TYPE
+            resp.stream = iter_ndjson(result)
         else:
-            if result.errors:
-                resp.status = falcon.HTTP_400
-                try:
-                    error = result.errors[0].message
-                except Exception:
-                    error = "Something Went Wrong"
-                resp.media = {"errors": [{"message": error}]}
-            resp.status = falcon.HTTP_200
+            resp.media = result
             resp.content_type = 'application/json'
 
 app.add_route("/", HomePageResource())
 app.add_route("/graphql", GraphQLResource())
+app.add_route("/health", HealthResource())
+app.add_route("/ready", ReadyResource())
+app.add_route("/stats", StatsResource())
+app.add_route("/metrics", MetricsResource())
 
+#Development server, handling every request in its own thread. Use server.py in production.
 if __name__ == "__main__":
+    from socketserver import ThreadingMixIn
     from wsgiref import simple_server
+
+    class ThreadingWSGIServer(ThreadingMixIn, simple_server.WSGIServer):
+        daemon_threads = True
+
     HOST = os.getenv('HOST', 'localhost')
-    PORT = os.getenv('PORT', 8000)
-    httpd = simple_server.make_server(HOST, PORT, app)
+    PORT = int(os.getenv('PORT', 8000))
+    httpd = simple_server.make_server(HOST, PORT, app, server_class=ThreadingWSGIServer)
     print("Development server running at http://{0}:{1}/".format(HOST, PORT))
     httpd.serve_forever()
\ No newline at end of file
@@ -1,18 +1,115 @@
-from pymongo import MongoClient
+import os
+import threading
+import time
+from pymongo.uri_parser import parse_uri
+from mongoengine import connect, disconnect, get_connection
+from dotenv import load_dotenv
 
-# The MongoDBConnection class is a context manager that allows you to connect to a MongoDB database and perform
-# operations on it.
+try:
+    from metrics import command_listener
+except ModuleNotFoundError:
+    from .metrics import command_listener
+
+load_dotenv()
+
+DB_CONNECTION_STRING = os.getenv('DB_CONNECTION_STRING', 'mongodb://127.0.0.1:27017/countries_db')
+# Database named in the connection string, used by mongoengine and by the raw pymongo queries alike
+DB_NAME = parse_uri(DB_CONNECTION_STRING)['database'] or 'countries_db'
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 0)) or None
+
+_connection_lock = threading.Lock()
+_connected = False
+
+
+def init_connection(mongo_client_class=None):
+    """
+    It registers the process-wide MongoDB client with mongoengine, so that the pymongo and mongoengine code paths
+    share one connection pool. Every command sent by the client is timed by the metrics listener. Calling it again
+    returns the already registered client.
+
+    :param mongo_client_class: Optional client class used instead of pymongo's MongoClient on the first call, e.g.
+    mongomock.MongoClient for the benchmarks
+    :return: The shared MongoClient
+    """
+    global _connected
+    with _connection_lock:
+        if not _connected:
+            options = {"mongo_client_class": mongo_client_class} if mongo_client_class is not None else {}
+            connect(
+                db=DB_NAME,
+                host=DB_CONNECTION_STRING,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                event_listeners=[command_listener],
+                **options
+            )
+            _connected = True
+    return get_connection()
+
+
+def close_connection():
+    """
+    It closes the shared MongoDB client and all the pooled sockets
+    """
+    global _connected
+    with _connection_lock:
+        if _connected:
+            disconnect()
+            _connected = False
+
+
+def reset_after_fork():
+    """
+    It drops the client a forked worker may have inherited from its parent, so that the next init_connection opens a
+    pool owned by the worker. pymongo gives the child a fresh topology at fork, so closing the copy does not touch the
+    sockets of the parent. The lock is recreated in case another thread of the parent held it during the fork.
+    """
+    global _connected, _connection_lock
+    _connection_lock = threading.Lock()
+    if _connected:
+        disconnect()
+        _connected = False
+
+
+def connection_health():
+    """
+    It pings the database through the shared client and reports the pool configuration
+
+    :return: A dictionary describing the connection status
+    """
+    health = {
+        "status": "ok",
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+    }
+    try:
+        started = time.perf_counter()
+        init_connection().admin.command('ping')
+        health["pingMs"] = round((time.perf_counter() - started) * 1000, 3)
+    except Exception as e:
+        health["status"] = "unavailable"
+        health["error"] = str(e)
+    return health
+
+
+# The MongoDBConnection class is a context manager that gives access to a MongoDB database, by default the one named in
+# DB_CONNECTION_STRING, through the shared connection pool. Leaving the context returns the socket to the pool instead
+# of closing the client.
 class MongoDBConnection:
-    def __init__(self, database):
-        self.host = 'localhost'
-        self.port = 27017
+    def __init__(self, database=DB_NAME):
         self.database = database
-        self.client = None
+        self.db = None
 
     def __enter__(self):
-        self.client = MongoClient(host=self.host, port=self.port)
-        self.db = self.client[self.database]
+        self.db = init_connection()[self.database]
         return self.db
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.client.close()
\ No newline at end of file
+        self.db = None
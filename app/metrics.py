@@ -0,0 +1,239 @@
+import os
+import time
+import threading
+import contextvars
+from inspect import isawaitable
+from pymongo import monitoring
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Time every field, not only the top-level ones. Nested fields mostly read dictionary keys, so this is for debugging.
+METRICS_ALL_FIELDS = os.getenv('METRICS_ALL_FIELDS', '0') == '1'
+TRACING_HEADER = os.getenv('TRACING_HEADER', 'X-GraphQL-Tracing')
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{0}="{1}"'.format(name, _escape_label(value)) for name, value in pairs) + "}"
+
+
+def _format_number(value):
+    return "+Inf" if value == float('inf') else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# The Counter class is a Prometheus counter with labels.
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = ["# HELP {0} {1}".format(self.name, self.documentation), "# TYPE {0} counter".format(self.name)]
+        for label_values, value in sorted(self._values.items()):
+            lines.append("{0}{1} {2}".format(self.name, _format_labels(self.labels, label_values), value))
+        return lines
+
+
+# The Gauge class is a Prometheus gauge with labels.
+class Gauge(Counter):
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = "# TYPE {0} gauge".format(self.name)
+        return lines
+
+
+# The Histogram class is a Prometheus histogram with labels and fixed buckets.
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts, total = self._values.get(label_values, ([0] * len(self.buckets), 0.0))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            self._values[label_values] = (counts, total + value)
+
+    def render(self):
+        lines = ["# HELP {0} {1}".format(self.name, self.documentation), "# TYPE {0} histogram".format(self.name)]
+        for label_values, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, ("le", _format_number(bound)))
+                lines.append("{0}_bucket{1} {2}".format(self.name, labels, cumulative))
+            labels = _format_labels(self.labels, label_values)
+            lines.append("{0}_sum{1} {2}".format(self.name, labels, total))
+            lines.append("{0}_count{1} {2}".format(self.name, labels, cumulative))
+        return lines
+
+
+operation_duration = Histogram(
+    "graphql_operation_duration_seconds", "Time spent executing GraphQL operations.", ("operation", "name"))
+field_duration = Histogram(
+    "graphql_field_duration_seconds", "Time spent in GraphQL field resolvers.", ("field",))
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds", "Round-trip time of MongoDB commands.", ("command",))
+mongo_command_failures = Counter(
+    "mongo_command_failures_total", "MongoDB commands that failed.", ("command",))
+rejected_operations = Counter(
+    "graphql_rejected_operations_total", "Operations rejected by the cost, depth or alias limits.", ("reason",))
+request_mongo_commands = Histogram(
+    "graphql_request_mongo_commands", "MongoDB commands sent per GraphQL request.", buckets=COUNT_BUCKETS)
+request_mongo_duration = Histogram(
+    "graphql_request_mongo_duration_seconds", "Total MongoDB round-trip time per GraphQL request.")
+
+METRICS = [
+    operation_duration, field_duration, mongo_command_duration, mongo_command_failures, rejected_operations,
+    request_mongo_commands, request_mongo_duration,
+]
+
+
+# The RequestMetrics class collects the MongoDB commands and, when tracing is on, the resolver timings of one request.
+class RequestMetrics:
+    def __init__(self, tracing=False):
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.tracing = tracing
+        self.mongo_commands = 0
+        self.mongo_duration = 0.0
+        self.resolvers = []
+
+    def finish(self):
+        """
+        It records the MongoDB usage of the request in the histograms
+
+        :return: The tracing extension of the response, or None when tracing is off
+        """
+        duration = time.perf_counter() - self.started
+        request_mongo_commands.observe(self.mongo_commands)
+        request_mongo_duration.observe(self.mongo_duration)
+        if not self.tracing:
+            return None
+        return {
+            "version": 1,
+            "startTime": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(self.started_at)),
+            "duration": int(duration * 1e9),
+            "execution": {"resolvers": self.resolvers},
+            "mongo": {"commands": self.mongo_commands, "duration": int(self.mongo_duration * 1e9)},
+        }
+
+
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+# The CommandMetricsListener class records the round-trip time of every MongoDB command, globally and for the
+# request being served.
+class CommandMetricsListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        duration = event.duration_micros / 1e6
+        mongo_command_duration.observe(duration, event.command_name)
+        request = current_request.get()
+        if request is not None:
+            request.mongo_commands += 1
+            request.mongo_duration += duration
+
+    def failed(self, event):
+        mongo_command_failures.inc(event.command_name)
+        self.succeeded(event)
+
+
+command_listener = CommandMetricsListener()
+
+
+def _path_list(path):
+    keys = []
+    while path is not None:
+        keys.append(path.key)
+        path = path.prev
+    return keys[::-1]
+
+
+# The TimingMiddleware class is a graphql-core middleware timing the resolvers of the top-level fields, or of every
+# field when METRICS_ALL_FIELDS is set, and recording them for the tracing extension when it is requested.
+class TimingMiddleware:
+    def resolve(self, next, root, info, **args):
+        if info.path.prev is not None and not METRICS_ALL_FIELDS:
+            return next(root, info, **args)
+        started = time.perf_counter()
+        result = next(root, info, **args)
+        if isawaitable(result):
+            return self._await(result, started, info)
+        self._record(started, info)
+        return result
+
+    async def _await(self, result, started, info):
+        try:
+            return await result
+        finally:
+            self._record(started, info)
+
+    def _record(self, started, info):
+        ended = time.perf_counter()
+        field_duration.observe(ended - started, "{0}.{1}".format(info.parent_type.name, info.field_name))
+        request = current_request.get()
+        if request is not None and request.tracing:
+            request.resolvers.append({
+                "path": _path_list(info.path),
+                "parentType": info.parent_type.name,
+                "fieldName": info.field_name,
+                "returnType": str(info.return_type),
+                "startOffset": int((started - request.started) * 1e9),
+                "duration": int((ended - started) * 1e9),
+            })
+
+
+timing_middleware = TimingMiddleware()
+
+
+def wants_tracing(req):
+    """
+    It tells whether the client asked for the tracing extension in the response
+    """
+    return req.get_header(TRACING_HEADER) in ('1', 'true')
+
+
+def render(extra_metrics=()):
+    """
+    It renders every metric in the Prometheus text format
+
+    :param extra_metrics: Metrics built by the caller for this scrape only, e.g. the cache counters
+    :return: The text of the /metrics endpoint
+    """
+    lines = []
+    for metric in METRICS + list(extra_metrics):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
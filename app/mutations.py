@@ -1,9 +1,7 @@
 import graphene
-from bson import ObjectId
-from mongoengine import connect, disconnect
-from schemas import Country
-from graphene_types import CountryOutputType
-from utils import DB_CONNECTION_STRING
+from graphql import GraphQLError
+from graphene_types import CountryOutputType, CountryEditInput, CountryEditResultType
+from repository import country_repository
 
 # This is a GraphQL mutation class that updates a country document in a MongoDB database with the provided key-value
 # pairs.
@@ -28,19 +26,42 @@ class EditCountry(graphene.Mutation):
 
     def mutate(self, info, **kwargs):
         """
-        This function updates a country document in a MongoDB database with the provided key-value pairs.
+        This function updates a country document in a MongoDB database with the provided key-value pairs. Only the
+        given fields are written, with a single $set, and the cached copy of the country is refreshed.
         :return: an instance of the `EditCountry` class with the updated `country` object as its argument.
         """
-        connect(host=DB_CONNECTION_STRING)
-        document_id = ObjectId(kwargs.get('id'))
-        country = Country.objects.get(id=document_id)
-        for key, value in kwargs.items():
-            if key != "id":
-                setattr(country, key, value)
-        country.save()
-        disconnect()
+        country_id = kwargs.pop('id')
+        [(_, country, error)], _, _ = country_repository.edit([(country_id, kwargs)])
+        if error is not None:
+            raise GraphQLError(error)
         return EditCountry(country=country)
 
-# The Mutation class defines a GraphQL mutation for editing a country.
+# This is a GraphQL mutation class that applies partial updates to many countries with one bulk write and reports the
+# outcome of every edit.
+class BulkEditCountries(graphene.Mutation):
+    class Arguments:
+        edits = graphene.List(graphene.NonNull(CountryEditInput), required=True)
+
+    results = graphene.List(CountryEditResultType)
+    matchedCount = graphene.Int()
+    modifiedCount = graphene.Int()
+
+    def mutate(self, info, edits):
+        """
+        It applies every patch as a $set on its country in a single unordered bulk_write. An invalid or failing edit
+        does not stop the others.
+        :return: an instance of the `BulkEditCountries` class with one result per edit, in the order of the edits.
+        """
+        results, matched, modified = country_repository.edit([(edit.id, dict(edit.patch)) for edit in edits])
+        return BulkEditCountries(
+            results=[
+                CountryEditResultType(id=country_id, ok=error is None, error=error, country=country)
+                for country_id, country, error in results
+            ],
+            matchedCount=matched,
+            modifiedCount=modified)
+
+# The Mutation class defines the GraphQL mutations for editing one or many countries.
 class Mutation(graphene.ObjectType):
-    countryEditMutation = EditCountry.Field()
\ No newline at end of file
+    countryEditMutation = EditCountry.Field()
+    countriesBulkEditMutation = BulkEditCountries.Field()
\ No newline at end of file
@@ -1,149 +1,180 @@
 import graphene
-from bson import ObjectId
-from graphene_types import CountryType, NearestCountryType
-from managers import MongoDBConnection
-from utils import get_nearest_countries, get_countries_by_language
+from graphene.relay import PageInfo
+from graphene_types import (
+    CountryType, NearestCountryType, CountrySortField, CountryConnectionType, LatLngInput, NearbyCountriesType,
+    CountryStatsType
+)
+from loaders import get_country_loader
+from repository import country_repository
+from utils import get_projection, collect_fields
 
 
 # It defines the Query object that contains the fields that can be queried.
 class Query(graphene.ObjectType):
 
     countriesQuery = graphene.List(CountryType, page=graphene.Int(), limit=graphene.Int())
+    countriesConnectionQuery = graphene.Field(
+        CountryConnectionType, first=graphene.Int(), after=graphene.String(),
+        sortBy=CountrySortField(default_value=CountrySortField.ID), descending=graphene.Boolean(default_value=False),
+        continent=graphene.String(), unMember=graphene.Boolean(),
+        minPopulation=graphene.Int(), maxPopulation=graphene.Int())
     countryQuery = graphene.Field(CountryType, id=graphene.ID(required=True))
+    countriesByIdsQuery = graphene.List(CountryType, ids=graphene.List(graphene.NonNull(graphene.ID), required=True))
     countriesNearbyQuery = graphene.List(
-        NearestCountryType, lat=graphene.Float(required=True), lng=graphene.Float(required=True))
-    countriesByLanguageQuery = graphene.List(CountryType, language=graphene.String(required=True))
+        NearestCountryType, lat=graphene.Float(required=True), lng=graphene.Float(required=True),
+        k=graphene.Int(default_value=10), maxDistanceKm=graphene.Float())
+    countriesNearbyBatchQuery = graphene.List(
+        NearbyCountriesType, points=graphene.List(graphene.NonNull(LatLngInput), required=True),
+        k=graphene.Int(default_value=10), maxDistanceKm=graphene.Float())
+    countriesByLanguageQuery = graphene.List(
+        CountryType, language=graphene.String(required=True), prefix=graphene.Boolean(default_value=False))
+    continentStatsQuery = graphene.List(CountryStatsType, continent=graphene.String())
+    languageStatsQuery = graphene.List(CountryStatsType, language=graphene.String())
 
     def resolve_countriesQuery(self, info,  page=None, limit=None):
         """
-        It takes the page and limit arguments from the query and uses them to slice the result of the MongoDB query
+        It takes the page and limit arguments from the query and reads that page from the storage backend, which
+        slices its cached country list, or pages through the database reading only the requested fields when the
+        cache is disabled
         
         :param info: This is the request context. It contains the request information, such as the query string, variables,
         operation name, etc
         :param page: The page number to return
         :param limit: The number of results to return
-        :return: A list of CountryType objects.
-        """
-        with MongoDBConnection("countries_db") as db_conn:
-            collection = db_conn['country']
-            result = collection.find()
-            if page and limit:
-                start = (page - 1) * limit
-                end = start + limit
-                result = result[start:end]
-            return [CountryType(
-                    id=item["_id"],
-                    name=item["name"]["common"],
-                    independent=item['independent'],
-                    status=item['status'],
-                    unMember=item['unMember'],
-                    currencies=next(iter(item['currencies'].keys())),
-                    capital=item['capital'],
-                    languages=item['languages'],
-                    latlng=item['latlng'],
-                    flag=item['flag'],
-                    maps=item['maps'],
-                    population=item['population'],
-                    timezones=item['timezones'],
-                    continents=item['continents'],
-                ) for item in result]
+        :return: A list of decoded countries.
+        """
+        return country_repository.page(page, limit, get_projection(info))
+        
+    def resolve_countriesConnectionQuery(self, info, first=None, after=None, sortBy=CountrySortField.ID,
+                                         descending=False, continent=None, unMember=None, minPopulation=None,
+                                         maxPopulation=None):
+        """
+        It pages through the countries with cursors, in the requested order and restricted by the optional filters.
+        The page size is capped on the server, and the total is only counted when the client asks for it.
         
+        :param info: This is the GraphQLResolveInfo object that contains information about the execution state of the query
+        :param first: The number of countries to return
+        :param after: The endCursor of the previous page
+        :param sortBy: The field to sort on
+        :param descending: Sort from the highest to the lowest value
+        :param continent: Only return the countries on this continent
+        :param unMember: Only return the countries with this UN membership
+        :param minPopulation: Only return the countries with at least this population
+        :param maxPopulation: Only return the countries with at most this population
+        :return: A CountryConnectionType object
+        """
+        filters = {}
+        if continent is not None:
+            filters['continents'] = continent
+        if unMember is not None:
+            filters['unMember'] = unMember
+        if minPopulation is not None or maxPopulation is not None:
+            filters['population'] = {}
+            if minPopulation is not None:
+                filters['population']['$gte'] = minPopulation
+            if maxPopulation is not None:
+                filters['population']['$lte'] = maxPopulation
+        selected = collect_fields(info)
+        node_fields = collect_fields(info, selected.get('edges', [])).get('node', [])
+        edges, has_next_page, total = country_repository.connection(
+            first, after, getattr(sortBy, 'value', sortBy), descending, filters,
+            get_projection(info, node_fields), 'totalCount' in selected)
+        return CountryConnectionType(
+            edges=[{"cursor": cursor, "node": item} for cursor, item in edges],
+            pageInfo=PageInfo(
+                has_next_page=has_next_page,
+                has_previous_page=bool(after),
+                start_cursor=edges[0][0] if edges else None,
+                end_cursor=edges[-1][0] if edges else None,
+            ),
+            totalCount=total,
+        )
+
     def resolve_countryQuery(self, info, id):
         """
-        It takes the id of a country, finds the country in the database, and returns the country's information
+        It takes the id of a country, finds the country through the request's loader, and returns the country's
+        information. All the countries requested in the same document are fetched together.
         
         :param info: This is the GraphQLResolveInfo object that contains information about the execution state of the query
         :param id: The id of the country
-        :return: A CountryType object
-        """
-        with MongoDBConnection("countries_db") as db_conn:
-            collection = db_conn['country']
-            document_id = ObjectId(id)
-            item = collection.find_one({'_id': document_id})
-            return CountryType(
-                    id=item["_id"],
-                    name=item["name"]["common"],
-                    independent=item['independent'],
-                    status=item['status'],
-                    unMember=item['unMember'],
-                    currencies=next(iter(item['currencies'].keys())),
-                    capital=item['capital'],
-                    languages=item['languages'],
-                    latlng=item['latlng'],
-                    flag=item['flag'],
-                    maps=item['maps'],
-                    population=item['population'],
-                    timezones=item['timezones'],
-                    continents=item['continents'],
-                )
+        :return: A decoded country
+        """
+        return get_country_loader(info).load(id, info)
+
+    def resolve_countriesByIdsQuery(self, info, ids):
+        """
+        It takes a list of country ids and returns the matching countries in the same order, fetched through the
+        request's loader
+        
+        :param info: This is the GraphQLResolveInfo object that contains information about the execution state of the query
+        :param ids: The ids of the countries
+        :return: A list of decoded countries, with null for ids that do not exist
+        """
+        return get_country_loader(info).load_many(ids, info)
         
-    def resolve_countriesNearbyQuery(self, info, lat, lng):
+    def resolve_countriesNearbyQuery(self, info, lat, lng, k=10, maxDistanceKm=None):
         """
-        It takes a latitude and longitude as arguments, uses a helper function to get the nearest countries, sorts them by distance, and returns the top 10 results
+        It takes a latitude and longitude as arguments and uses the spatial index to get the k nearest countries,
+        sorted by distance
         
         :param info: GraphQLResolveInfo
-        :param ltd: latitude
+        :param lat: latitude
         :param lng: longitude
-        :return: A list of NearestCountryType objects
-        """
-        countries = get_nearest_countries(lat, lng)
-        sorted_list = sorted([{
-                "id":str(item["id"]),
-                "name":item["name"]["common"],
-                "independent":item['independent'],
-                "status":item['status'],
-                "unMember":item['unMember'],
-                "currencies":next(iter(item['currencies'].keys())),
-                "capital":item['capital'],
-                "languages":item['languages'],
-                "latlng":item['latlng'],
-                "flag":item['flag'],
-                "maps":item['maps'],
-                "population":item['population'],
-                "timezones":item['timezones'],
-                "continents":item['continents'],
-                "distance":float(item.distance)
-            } for item in countries], key=lambda x: x["distance"])[1:11]
-        return [NearestCountryType(
-                    id=item["id"],
-                    name=item["name"],
-                    independent=item['independent'],
-                    status=item['status'],
-                    unMember=item['unMember'],
-                    currencies=item['currencies'],
-                    capital=item['capital'],
-                    languages=item['languages'],
-                    latlng=item['latlng'],
-                    flag=item['flag'],
-                    maps=item['maps'],
-                    population=item['population'],
-                    timezones=item['timezones'],
-                    continents=item['continents'],
-                    distance=item['distance']
-                ) for item in sorted_list]
+        :param k: The number of countries to return
+        :param maxDistanceKm: Optional radius in kilometers
+        :return: A list of decoded countries with their distance
+        """
+        countries = country_repository.nearest(lat, lng, k, maxDistanceKm)
+        return [dict(item, distance=distance) for distance, item in countries]
 
-    def resolve_countriesByLanguageQuery(self, info, language):
+    def resolve_countriesNearbyBatchQuery(self, info, points, k=10, maxDistanceKm=None):
         """
-        It returns a list of countries that speak the language specified in the query.
+        It takes a list of points and returns the k nearest countries of each one, computed together in one
+        vectorized pass
+        
+        :param info: GraphQLResolveInfo
+        :param points: The list of LatLngInput points
+        :param k: The number of countries to return per point
+        :param maxDistanceKm: Optional radius in kilometers
+        :return: A list of points with their nearest countries, in the order of the points
+        """
+        coordinates = [(point.lat, point.lng) for point in points]
+        results = country_repository.nearest_many(coordinates, k, maxDistanceKm)
+        return [{
+                    "lat": lat,
+                    "lng": lng,
+                    "countries": [dict(item, distance=distance) for distance, item in countries],
+                } for (lat, lng), countries in zip(coordinates, results)]
+
+    def resolve_countriesByLanguageQuery(self, info, language, prefix=False):
+        """
+        It returns a list of countries that speak the language specified in the query, ignoring case.
+        
+        :param info: This is the context of the query. It contains the request, the schema, and the root value
+        :param language: String!
+        :param prefix: match every language starting with the given text
+        :return: A list of decoded countries, with their currencies dictionary
+        """
+        return [dict(item, currencies=item.get("currencyDetails"))
+                for item in country_repository.by_language(language, prefix)]
+
+    def resolve_continentStatsQuery(self, info, continent=None):
+        """
+        It returns the number of countries, their total and average population and the number of UN members of each
+        continent, read from summaries kept up to date on every edit, so clients do not download every country
         
         :param info: This is the context of the query. It contains the request, the schema, and the root value
-        :param lang: String!
-        :return: A list of CountryType objects
-        """
-        countries = get_countries_by_language(language)
-        return [CountryType(
-                    id=item["id"],
-                    name=item["name"]["common"],
-                    independent=item['independent'],
-                    status=item['status'],
-                    unMember=item['unMember'],
-                    currencies=item['currencies'],
-                    capital=item['capital'],
-                    languages=item['languages'],
-                    latlng=item['latlng'],
-                    flag=item['flag'],
-                    maps=item['maps'],
-                    population=item['population'],
-                    timezones=item['timezones'],
-                    continents=item['continents'],
-                ) for item in countries]
\ No newline at end of file
+        :param continent: Only return this continent
+        :return: A list of summaries sorted by continent name
+        """
+        return country_repository.continent_stats(continent)
+
+    def resolve_languageStatsQuery(self, info, language=None):
+        """
+        It returns the same summaries as continentStatsQuery for every language spoken in the countries
+        
+        :param info: This is the context of the query. It contains the request, the schema, and the root value
+        :param language: Only return this language, ignoring case
+        :return: A list of summaries sorted by language name
+        """
+        return country_repository.language_stats(language)
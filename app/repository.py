@@ -0,0 +1,352 @@
+import os
+import time
+import operator
+import threading
+from bisect import bisect_left, bisect_right
+from bson import json_util
+from graphql import GraphQLError
+from cache import country_cache
+from indexes import spatial_index, language_index, continent_stats, language_stats
+from managers import MongoDBConnection
+from utils import (
+    MAX_PAGE_SIZE, MAX_NEARBY_BATCH_POINTS, FIELD_PATHS, decode_country, decode_cursor, encode_cursor, build_indexes,
+    refresh_row, get_countries, get_countries_page, get_countries_by_ids, get_countries_connection,
+    get_nearest_countries, get_nearest_countries_batch, get_countries_by_language, get_continent_stats,
+    get_language_stats, ensure_indexes_loaded, load_indexes, edit_countries
+)
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# mongo reads through MongoDB and the country cache, memory serves every read from a copy of the whole dataset
+COUNTRY_BACKEND = os.getenv('COUNTRY_BACKEND', 'mongo')
+# JSON file of raw country documents loaded by the memory backend instead of MongoDB, which makes the node read-only
+MEMORY_SNAPSHOT_PATH = os.getenv('MEMORY_SNAPSHOT_PATH') or None
+# How the memory backend follows MongoDB: none, poll (reload every MEMORY_POLL_SECONDS) or changestream. When it is
+# not set, server.py picks poll for more than one worker, as each worker only applies its own edits to its copy.
+MEMORY_REFRESH = os.getenv('MEMORY_REFRESH') or 'none'
+MEMORY_POLL_SECONDS = float(os.getenv('MEMORY_POLL_SECONDS', 60))
+
+# Decoded row key of each Mongo path used by the connection filters and sort orders
+ROW_KEYS = {path: field for field, path in FIELD_PATHS.items()}
+COMPARISONS = {'$gt': operator.gt, '$gte': operator.ge, '$lt': operator.lt, '$lte': operator.le}
+
+
+# The MongoCountryRepository class is the default storage backend. Reads go through the country cache, which is filled
+# from MongoDB, and writes go to MongoDB.
+class MongoCountryRepository:
+    uses_database = True
+
+    def start(self):
+        ensure_indexes_loaded()
+
+    def start_refresh(self):
+        pass
+
+    def reload(self):
+        """
+        It drops the cached countries and rebuilds the indexes from MongoDB
+        """
+        country_cache.invalidate()
+        load_indexes()
+
+    def all(self):
+        return get_countries()
+
+    def page(self, page=None, limit=None, projection=None):
+        return get_countries_page(page, limit, projection)
+
+    def by_ids(self, country_ids, projection=None):
+        return get_countries_by_ids(country_ids, projection)
+
+    def connection(self, first=None, after=None, sort_by="_id", descending=False, filters=None, projection=None,
+                   with_total=False):
+        return get_countries_connection(first, after, sort_by, descending, filters, projection, with_total)
+
+    def nearest(self, lat, lng, k=10, max_distance_km=None):
+        return get_nearest_countries(lat, lng, k, max_distance_km)
+
+    def nearest_many(self, points, k=10, max_distance_km=None):
+        return get_nearest_countries_batch(points, k, max_distance_km)
+
+    def by_language(self, language, prefix=False):
+        return get_countries_by_language(language, prefix)
+
+    def continent_stats(self, continent=None):
+        return get_continent_stats(continent)
+
+    def language_stats(self, language=None):
+        return get_language_stats(language)
+
+    def edit(self, edits):
+        return edit_countries(edits)
+
+
+def sort_key(value):
+    """
+    It makes values of one field comparable in Mongo order, where a missing value sorts first
+    """
+    return (value is not None, value if value is not None else 0)
+
+
+def matches(row, filters):
+    """
+    It applies the subset of the Mongo filter language built by the connection query to a decoded country: equality,
+    membership for list fields, and $gt/$gte/$lt/$lte
+    """
+    for path, condition in (filters or {}).items():
+        value = row.get(ROW_KEYS.get(path, path))
+        if isinstance(condition, dict):
+            for comparison, bound in condition.items():
+                if value is None or not COMPARISONS[comparison](value, bound):
+                    return False
+        elif isinstance(value, list):
+            if condition not in value:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+# The MemoryCountryRepository class keeps the whole dataset in memory, loaded once from MongoDB or from a JSON
+# snapshot, and serves every read without I/O. With a MongoDB source, edits are written to MongoDB and applied to the
+# copy, and the copy can follow changes made elsewhere by polling or through a change stream.
+class MemoryCountryRepository:
+    def __init__(self, snapshot_path=None, refresh=MEMORY_REFRESH, poll_seconds=MEMORY_POLL_SECONDS):
+        self.snapshot_path = snapshot_path
+        self.refresh = refresh
+        self.poll_seconds = poll_seconds
+        self.uses_database = not snapshot_path
+        self._rows = []
+        self._positions = {}
+        self._orders = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+        # Pre-forking servers turn this off in the master and call start_refresh in every worker instead
+        self.refresh_on_start = True
+
+    def load_documents(self):
+        """
+        It reads the raw country documents from the snapshot file or from MongoDB
+        """
+        if not self.uses_database:
+            with open(self.snapshot_path) as f:
+                return json_util.loads(f.read())
+        with MongoDBConnection() as db_conn:
+            return list(db_conn['country'].find())
+
+    def load(self):
+        """
+        It replaces the copy with the current dataset and rebuilds the indexes
+
+        :return: Whether the dataset changed
+        """
+        rows = [decode_country(item) for item in self.load_documents()]
+        with self._lock:
+            changed = rows != self._rows
+            if changed or not self._loaded:
+                self._rows = rows
+                self._positions = {row["id"]: position for position, row in enumerate(rows)}
+                self._orders = {}
+                build_indexes(rows)
+                country_cache.reset_version(rows)
+                self._loaded = True
+        return changed
+
+    def start(self):
+        """
+        It loads the dataset and starts following MongoDB, unless refresh_on_start was turned off
+        """
+        self.load()
+        if self.refresh_on_start:
+            self.start_refresh()
+
+    def reload(self):
+        """
+        It replaces the copy with the current dataset of the snapshot file or of MongoDB
+        """
+        self.load()
+
+    def start_refresh(self):
+        """
+        It starts following MongoDB in a background thread when a refresh mode is configured. Threads do not survive
+        a fork, so pre-forked workers call it once they are running, while the master never follows MongoDB.
+        """
+        if self.uses_database and self.refresh in ('poll', 'changestream'):
+            target = self._watch if self.refresh == 'changestream' else self._poll
+            threading.Thread(target=target, name="country-refresh", daemon=True).start()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.load()
+            except Exception as e:
+                print(e)
+
+    def _watch(self):
+        """
+        It applies the inserts, updates, replaces and deletes of the country collection as they happen. After an error,
+        for example a standalone server without change streams, it reloads everything and waits before watching again.
+        """
+        while True:
+            try:
+                with MongoDBConnection() as db_conn:
+                    with db_conn['country'].watch(full_document='updateLookup') as stream:
+                        for change in stream:
+                            if change['operationType'] == 'delete':
+                                self.remove(str(change['documentKey']['_id']))
+                            elif change.get('fullDocument') is not None:
+                                self.apply(decode_country(change['fullDocument']))
+            except Exception as e:
+                print(e)
+                time.sleep(self.poll_seconds)
+                try:
+                    self.load()
+                except Exception as e:
+                    print(e)
+
+    def apply(self, row):
+        """
+        It inserts or replaces a decoded country in the copy and in the indexes
+        """
+        with self._lock:
+            position = self._positions.get(row["id"])
+            if position is None:
+                self._positions[row["id"]] = len(self._rows)
+                self._rows.append(row)
+            else:
+                self._rows[position] = row
+            self._orders = {}
+            refresh_row(row)
+
+    def remove(self, country_id):
+        """
+        It drops a country from the copy and from the indexes
+        """
+        with self._lock:
+            if country_id not in self._positions:
+                return
+            self._rows = [row for row in self._rows if row["id"] != country_id]
+            self._positions = {row["id"]: position for position, row in enumerate(self._rows)}
+            self._orders = {}
+            spatial_index.remove(country_id)
+            language_index.remove(country_id)
+            continent_stats.remove(country_id)
+            language_stats.remove(country_id)
+            country_cache.invalidate(country_id)
+
+    def all(self):
+        self._ensure_loaded()
+        return self._rows
+
+    def page(self, page=None, limit=None, projection=None):
+        self._ensure_loaded()
+        if page and limit:
+            start = (page - 1) * limit
+            return self._rows[start:start + limit]
+        return self._rows
+
+    def by_ids(self, country_ids, projection=None):
+        self._ensure_loaded()
+        rows = self._rows
+        found = {}
+        for country_id in country_ids:
+            position = self._positions.get(str(country_id))
+            if position is not None and position < len(rows):
+                found[str(country_id)] = rows[position]
+        return found
+
+    def _order(self, sort_by):
+        """
+        It returns the countries sorted by the field and then by id, with the matching list of sort keys for bisect.
+        Both are kept until the next change of the copy.
+        """
+        order = self._orders.get(sort_by)
+        if order is None:
+            key = ROW_KEYS.get(sort_by, sort_by)
+            rows = sorted(self._rows, key=lambda row: (sort_key(row.get(key)), row["id"]))
+            order = ([(sort_key(row.get(key)), row["id"]) for row in rows], rows)
+            self._orders[sort_by] = order
+        return order
+
+    def connection(self, first=None, after=None, sort_by="_id", descending=False, filters=None, projection=None,
+                   with_total=False):
+        """
+        It pages through the copy with the same cursors as the MongoDB backend
+        """
+        self._ensure_loaded()
+        first = MAX_PAGE_SIZE if first is None else max(0, min(first, MAX_PAGE_SIZE))
+        keys, rows = self._order(sort_by)
+        start, end = 0, len(rows)
+        if after:
+            sort_value, document_id = decode_cursor(after)
+            pivot = (sort_key(sort_value), str(document_id))
+            if descending:
+                end = bisect_left(keys, pivot)
+            else:
+                start = bisect_right(keys, pivot)
+        candidates = reversed(rows[start:end]) if descending else rows[start:end]
+        page = []
+        for row in candidates:
+            if matches(row, filters):
+                page.append(row)
+                if len(page) > first:
+                    break
+        key = ROW_KEYS.get(sort_by, sort_by)
+        edges = [(encode_cursor(row.get(key), row["id"]), row) for row in page[:first]]
+        total = sum(1 for row in rows if matches(row, filters)) if with_total else None
+        return edges, len(page) > first, total
+
+    def nearest(self, lat, lng, k=10, max_distance_km=None):
+        self._ensure_loaded()
+        return spatial_index.nearest(lat, lng, k + 1, max_distance_km)[1:]
+
+    def nearest_many(self, points, k=10, max_distance_km=None):
+        if len(points) > MAX_NEARBY_BATCH_POINTS:
+            raise GraphQLError("At most {0} points can be sent in one batch".format(MAX_NEARBY_BATCH_POINTS))
+        self._ensure_loaded()
+        return [countries[1:] for countries in spatial_index.nearest_many(points, k + 1, max_distance_km)]
+
+    def by_language(self, language, prefix=False):
+        self._ensure_loaded()
+        return language_index.lookup(language, prefix)
+
+    def continent_stats(self, continent=None):
+        self._ensure_loaded()
+        return continent_stats.summaries(continent)
+
+    def language_stats(self, language=None):
+        self._ensure_loaded()
+        return language_stats.summaries(language)
+
+    def edit(self, edits):
+        """
+        It writes the edits to MongoDB and applies the saved countries to the copy. Nodes serving a snapshot are
+        read-only.
+        """
+        if not self.uses_database:
+            raise GraphQLError("Countries cannot be edited on a node serving a snapshot")
+        results, matched, modified = edit_countries(edits)
+        for _, country, _ in results:
+            if country is not None:
+                self.apply(decode_country(country.to_mongo()))
+        return results, matched, modified
+
+
+def create_repository(backend=COUNTRY_BACKEND):
+    """
+    It builds the storage backend selected by COUNTRY_BACKEND
+    """
+    if backend == 'memory':
+        return MemoryCountryRepository(MEMORY_SNAPSHOT_PATH)
+    if backend == 'mongo':
+        return MongoCountryRepository()
+    raise ValueError("Unknown country backend {0}".format(backend))
+
+
+country_repository = create_repository()
@@ -1,10 +1,11 @@
 from mongoengine import (
     BooleanField, DictField, Document, 
-    FloatField, IntField, ListField, StringField, queryset_manager
+    FloatField, IntField, ListField, StringField
 )
 
 # It's a class that represents a country
 class Country(Document):
+    cca3 = StringField(max_length=3)
     name = DictField()
     independent = BooleanField(default=True)
     status = BooleanField(default=True)
@@ -19,18 +20,10 @@ class Country(Document):
     timezones = ListField(StringField(max_length=15), default=list)
     continents = ListField(StringField(max_length=15), default=list)
 
-    @queryset_manager
-    def with_distance(cls, queryset, lat, lng):
-        """
-        It takes a queryset, and returns a queryset with a new field called distance
-        
-        :param cls: The class of the model that the queryset is for
-        :param queryset: The queryset that is being filtered
-        :param lat: latitude of the user
-        :param lng: longitude
-        :return: A queryset of documents with a new field called distance.
-        """
-        from utils import get_distance
-        for doc in queryset:
-            doc.distance = get_distance(doc, lat, lng)
-        return queryset
+    meta = {
+        'indexes': [
+            'languages', 'continents', 'name.common', 'population', 'unMember',
+            ('continents', 'population'),
+            {'fields': ['cca3'], 'unique': True, 'sparse': True},
+        ],
+    }
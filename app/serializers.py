@@ -0,0 +1,91 @@
+import os
+import json
+import falcon
+from falcon import media
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Preferred JSON library: auto picks orjson, then ujson, then the standard library, depending on what is installed
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+def _load_backend(name):
+    """
+    It imports the requested JSON library and returns its dumps and loads functions
+
+    :param name: orjson, ujson, json or auto
+    :return: A tuple of the backend name, the dumps function and the loads function
+    """
+    candidates = ['orjson', 'ujson', 'json'] if name == 'auto' else [name]
+    for candidate in candidates:
+        if candidate == 'orjson':
+            try:
+                import orjson
+            except ImportError:
+                continue
+            return 'orjson', orjson.dumps, orjson.loads
+        if candidate == 'ujson':
+            try:
+                import ujson
+            except ImportError:
+                continue
+            return 'ujson', _bytes_dumps(ujson.dumps), ujson.loads
+        if candidate == 'json':
+            return 'json', _bytes_dumps(json.dumps), json.loads
+    raise ValueError("JSON backend {0} is not installed".format(name))
+
+
+def _bytes_dumps(dumps):
+    """
+    It wraps a dumps function returning a string so that it returns UTF-8 bytes, like orjson
+    """
+    def dumps_bytes(obj):
+        return dumps(obj, ensure_ascii=False).encode('utf-8')
+    return dumps_bytes
+
+
+backend, dumps, loads = _load_backend(JSON_BACKEND)
+
+# Falcon media handler used for req.media and resp.media by both the WSGI and the ASGI apps
+json_handler = media.JSONHandler(dumps=dumps, loads=loads)
+
+
+def configure_media(app):
+    """
+    It registers the JSON handler of the configured backend on a falcon app, for requests and responses
+    """
+    app.req_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+    app.resp_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+
+
+def wants_ndjson(req):
+    """
+    It tells whether the client asked for a streamed newline-delimited JSON response
+    """
+    return NDJSON_CONTENT_TYPE in (req.accept or '')
+
+
+def iter_ndjson(data):
+    """
+    It serializes a GraphQL result one line at a time: every item of a top-level list field becomes its own line, so
+    the response is written while it is being serialized instead of as one large document
+
+    :param data: The data of the execution result
+    :return: A generator of encoded lines
+    """
+    for field, value in (data or {}).items():
+        if isinstance(value, list):
+            for item in value:
+                yield dumps({field: item}) + b'\n'
+        else:
+            yield dumps({field: value}) + b'\n'
+
+
+async def aiter_ndjson(data):
+    """
+    It is the asynchronous variant of iter_ndjson, for the ASGI app
+    """
+    for line in iter_ndjson(data):
+        yield line
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import multiprocessing
+
+STARTED = time.perf_counter()
+
+from gunicorn.app.base import BaseApplication
+from dotenv import load_dotenv
+
+load_dotenv()
+
+#Production entry point: a gunicorn master loads the app, connects to MongoDB and warms up the caches and indexes once,
+#then forks WORKERS worker processes that share that memory copy-on-write, each serving THREADS threads. Run it with
+#python app/server.py, or python app/server.py --asgi to serve the ASGI app with uvicorn workers.
+#kill -HUP <master pid> reloads the dataset in the master and replaces the workers gracefully: new workers are forked
+#from the reloaded master and the old ones finish their requests within GRACEFUL_TIMEOUT seconds. The code is not
+#reloaded, as it was imported before the first fork; restart the server to deploy a new version. kill -TERM <master pid>
+#shuts down gracefully.
+
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', 8000))
+WORKERS = int(os.getenv('WORKERS', multiprocessing.cpu_count() * 2 + 1))
+THREADS = int(os.getenv('THREADS', 1))
+TIMEOUT = int(os.getenv('TIMEOUT', 30))
+GRACEFUL_TIMEOUT = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+KEEPALIVE = int(os.getenv('KEEPALIVE', 5))
+
+
+def post_fork(server, worker):
+    """
+    It gives the new worker its own MongoDB connection pool, as sockets must not be shared with the master, and
+    starts the background threads of the storage backend
+    """
+    from managers import init_connection, reset_after_fork
+    from repository import country_repository
+    reset_after_fork()
+    if country_repository.uses_database:
+        init_connection()
+    country_repository.start_refresh()
+
+
+def on_reload(server):
+    """
+    It reloads the countries, the indexes and the caches in the master on kill -HUP, before the new workers are forked
+    from it, then closes the MongoDB client again
+    """
+    from managers import close_connection
+    from service import reload
+    reload()
+    close_connection()
+
+
+# The Server class is a gunicorn application serving the falcon app with the configuration read from the environment.
+class Server(BaseApplication):
+    def __init__(self, asgi=False):
+        self.asgi = asgi
+        self.options = {
+            "bind": "{0}:{1}".format(HOST, PORT),
+            "workers": WORKERS,
+            "threads": THREADS,
+            "worker_class": "uvicorn.workers.UvicornWorker" if asgi else ("gthread" if THREADS > 1 else "sync"),
+            "preload_app": True,
+            "timeout": TIMEOUT,
+            "graceful_timeout": GRACEFUL_TIMEOUT,
+            "keepalive": KEEPALIVE,
+            "post_fork": post_fork,
+            "on_reload": on_reload,
+        }
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        """
+        It imports the app in the master, which runs the startup and warm-up, then closes the MongoDB client so that
+        the forked workers do not inherit its sockets
+        """
+        from repository import MemoryCountryRepository, country_repository
+        # A refresh thread in the master would reopen the MongoDB client closed below, and its copy would be inherited
+        # by the workers forked on reload
+        country_repository.refresh_on_start = False
+        # Every worker applies only its own edits to its copy of the dataset, so with several workers the copies
+        # converge only by following MongoDB
+        if isinstance(country_repository, MemoryCountryRepository) and country_repository.uses_database \
+                and WORKERS > 1:
+            if not os.getenv('MEMORY_REFRESH'):
+                country_repository.refresh = 'poll'
+            elif country_repository.refresh == 'none':
+                print("MEMORY_REFRESH=none with {0} workers: edits only reach the worker that made them".format(
+                    WORKERS))
+        if self.asgi:
+            from asgi import app
+        else:
+            from main import app
+        from managers import close_connection
+        from service import readiness
+        close_connection()
+        readiness["coldStartSeconds"] = round(time.perf_counter() - STARTED, 3)
+        print("Warm-up done in {0}s, cold start {1}s, forking {2} workers".format(
+            readiness.get("startupSeconds"), readiness["coldStartSeconds"], WORKERS))
+        return app
+
+
+if __name__ == "__main__":
+    Server(asgi="--asgi" in sys.argv[1:]).run()
@@ -0,0 +1,504 @@
+import os
+import json
+import time
+import math
+import atexit
+import asyncio
+import hashlib
+import threading
+import functools
+import contextvars
+from inspect import isawaitable
+from concurrent.futures import ThreadPoolExecutor
+import falcon
+import graphene
+from graphql import (
+    GraphQLError, ExecutionResult, ExecutionContext, OperationType, get_operation_ast, get_named_type, is_leaf_type,
+    is_object_type, parse, print_ast, validate, specified_rules, execute as execute_document
+)
+from graphene.types.resolver import dict_or_attr_resolver, dict_resolver
+from queries import Query
+from mutations import Mutation
+from managers import MONGO_MAX_POOL_SIZE, init_connection, close_connection, connection_health
+from cache import TTLCache, country_cache
+from utils import ensure_indexes
+from repository import country_repository
+from serializers import loads
+from complexity import LIMIT_RULES, check_cost
+from metrics import (
+    METRICS_ALL_FIELDS, RequestMetrics, Counter, Gauge, current_request, operation_duration, timing_middleware,
+    render as render_metrics
+)
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INDEX_HTML_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'static/html/index.html'))
+RESOLVER_THREADS = int(os.getenv('RESOLVER_THREADS', MONGO_MAX_POOL_SIZE))
+DOCUMENT_CACHE_SIZE = int(os.getenv('DOCUMENT_CACHE_SIZE', 256))
+PERSISTED_QUERY_CACHE_SIZE = int(os.getenv('PERSISTED_QUERY_CACHE_SIZE', 1000))
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1000))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 60))
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', 60))
+STATIC_CACHE_MAX_AGE = int(os.getenv('STATIC_CACHE_MAX_AGE', 3600))
+
+# The schema is shared by the WSGI app in main.py and the ASGI app in asgi.py
+schema = graphene.Schema(query=Query, mutation=Mutation)
+
+REQUEST_ERRORS = (ValueError, KeyError, TypeError, GraphQLError, SyntaxError)
+
+# Parsed and validated documents keyed by the sha256 of their source, and the sources of the automatic persisted
+# queries keyed by the hash the clients send. Neither expires, both are bounded LRUs.
+document_cache = TTLCache(DOCUMENT_CACHE_SIZE, math.inf)
+persisted_queries = TTLCache(PERSISTED_QUERY_CACHE_SIZE, math.inf)
+# Complete responses of query operations keyed by dataset version, normalized document, variables and operation name
+response_cache = TTLCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+# Common documents parsed and validated during warm-up
+WARM_UP_DOCUMENTS = [
+    "{ countriesQuery { id name languages } }",
+    'query Country($id: ID!) { countryQuery(id: $id) { id name status currencies } }',
+    "query Nearby($lat: Float!, $lng: Float!) { countriesNearbyQuery(lat: $lat, lng: $lng) { id name } }",
+    "query Language($language: String!) { countriesByLanguageQuery(language: $language) { id name languages } }",
+]
+# Startup durations and warm-up state of this process, reported by /ready
+readiness = {"ready": False}
+_warm_up_lock = threading.Lock()
+
+# The home page never changes while the process runs, so it is read once and served from memory
+with open(INDEX_HTML_PATH, 'r') as f:
+    INDEX_HTML = f.read()
+INDEX_HTML_ETAG = hashlib.sha256(INDEX_HTML.encode('utf-8')).hexdigest()[:32]
+
+
+def startup():
+    """
+    It opens the shared MongoDB connection pool, closes it at exit and creates the MongoDB indexes, unless the node
+    serves a snapshot without a database. Then it starts the storage backend, which loads the whole dataset in memory
+    mode, and warms up the caches. The duration of every step is kept for the /ready endpoint.
+    """
+    started = time.perf_counter()
+    if country_repository.uses_database:
+        init_connection()
+        atexit.register(close_connection)
+        try:
+            ensure_indexes()
+        except Exception as e:
+            print(e)
+    readiness["connectSeconds"] = round(time.perf_counter() - started, 3)
+    try:
+        country_repository.start()
+    except Exception as e:
+        print(e)
+    warm_up()
+    readiness["startupSeconds"] = round(time.perf_counter() - started, 3)
+
+
+def warm_up():
+    """
+    It loads the countries and the spatial and language indexes and parses the common documents, so that the first
+    requests do not pay for it. Once it succeeds the process reports itself as ready; until then it is retried by
+    the /ready endpoint.
+
+    :return: Whether the process is ready
+    """
+    with _warm_up_lock:
+        if readiness["ready"]:
+            return True
+        started = time.perf_counter()
+        try:
+            readiness["countries"] = len(country_repository.all())
+        except Exception as e:
+            readiness["error"] = str(e)
+            return False
+        for source in WARM_UP_DOCUMENTS:
+            get_document(source)
+        readiness.pop("error", None)
+        readiness["warmUpSeconds"] = round(time.perf_counter() - started, 3)
+        readiness["ready"] = True
+        return True
+
+
+def reload():
+    """
+    It reloads the dataset from the storage backend, drops the cached responses and warms up again. Pre-forking servers
+    call it in the master on reload, so the workers forked next start from the current data.
+    """
+    started = time.perf_counter()
+    if country_repository.uses_database:
+        init_connection()
+    try:
+        country_repository.reload()
+    except Exception as e:
+        print(e)
+    response_cache.clear()
+    readiness["ready"] = False
+    warm_up()
+    readiness["reloadSeconds"] = round(time.perf_counter() - started, 3)
+
+
+def get_health():
+    """
+    It reports the health of the MongoDB connection pool. Nodes serving a snapshot do not use the database, so they
+    are healthy once the countries are loaded.
+
+    :return: A tuple of the falcon status and the response media
+    """
+    if country_repository.uses_database:
+        health = connection_health()
+    else:
+        health = {"status": "ok" if readiness["ready"] else "loading", "database": "unused"}
+    return (falcon.HTTP_200 if health["status"] == "ok" else falcon.HTTP_503), health
+
+
+def get_readiness():
+    """
+    It reports whether warm-up is done, with the measured startup durations
+
+    :return: A tuple of the falcon status and the response media
+    """
+    ready = warm_up()
+    return (falcon.HTTP_200 if ready else falcon.HTTP_503), dict(readiness, pid=os.getpid())
+
+
+def query_hash(source):
+    """
+    It returns the hex sha256 of a GraphQL document, as used by the automatic persisted queries protocol
+    """
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def get_operation(data):
+    """
+    It extracts the GraphQL document and the variables from a decoded request body. Requests following the automatic
+    persisted queries protocol may send only the sha256 hash of a document that was registered by an earlier request.
+
+    :param data: The decoded JSON body of the request
+    :return: A tuple of the document source and the variables
+    """
+    if not isinstance(data, dict):
+        raise ValueError("The request body must be a JSON object")
+    extensions = data.get('extensions') or {}
+    if not isinstance(extensions, dict):
+        raise ValueError("extensions must be a JSON object")
+    persisted = extensions.get('persistedQuery')
+    if persisted:
+        sha256_hash = persisted['sha256Hash']
+        if not isinstance(sha256_hash, str):
+            raise ValueError("sha256Hash must be a string")
+        action = data.get('query') or data.get('mutation')
+        if action is not None and not isinstance(action, str):
+            raise ValueError("The query must be a string")
+        if action is None:
+            action = persisted_queries.get(sha256_hash)
+            if action is None:
+                raise GraphQLError("PersistedQueryNotFound", extensions={"code": "PERSISTED_QUERY_NOT_FOUND"})
+        elif query_hash(action) != sha256_hash:
+            raise GraphQLError("provided sha does not match query", extensions={"code": "INTERNAL_SERVER_ERROR"})
+        else:
+            persisted_queries.set(sha256_hash, action)
+        return action, data.get('variables')
+    action = data['query'] if 'query' in data else data['mutation']
+    if not isinstance(action, str):
+        raise ValueError("The query must be a string")
+    return action, data.get('variables')
+
+
+def get_document(source):
+    """
+    It parses and validates a GraphQL document, reusing the result of earlier requests with the same source. Besides
+    the standard rules, the validation enforces the depth and alias limits. The hash of the printed document is
+    returned too, so that sources differing only by formatting share a response cache entry.
+
+    :param source: The GraphQL document as a string
+    :return: A tuple of the parsed document, the list of validation errors and the hash of the normalized document
+    """
+    key = query_hash(source)
+    cached = document_cache.get(key)
+    if cached is not None:
+        return cached[0], [], cached[1]
+    try:
+        document = parse(source)
+    except GraphQLError as error:
+        return None, [error], None
+    errors = validate(schema.graphql_schema, document, list(specified_rules) + LIMIT_RULES)
+    normalized = query_hash(print_ast(document))
+    if not errors:
+        document_cache.set(key, (document, normalized))
+    return document, errors, normalized
+
+
+def format_result(result):
+    """
+    It converts an execution result into the status and the body of the response
+
+    :param result: The ExecutionResult returned by the schema
+    :return: A tuple of the falcon status and the response media
+    """
+    if result.errors:
+        error = {"message": "Something Went Wrong"}
+        try:
+            error["message"] = result.errors[0].message
+            if result.errors[0].extensions:
+                error["extensions"] = result.errors[0].extensions
+        except Exception:
+            pass
+        return falcon.HTTP_200, {"errors": [error]}
+    return falcon.HTTP_200, result.data
+
+
+def format_error(ex):
+    """
+    It converts an exception raised while reading or executing the request into the status and the body of the response
+    """
+    error = {"message": str(ex)}
+    if isinstance(ex, GraphQLError) and ex.extensions:
+        error["extensions"] = ex.extensions
+    return falcon.HTTP_400, {"errors": [error]}
+
+
+def get_params_data(params):
+    """
+    It builds the equivalent of a POST body from the query string parameters of a GET request
+
+    :param params: The query string parameters
+    :return: The decoded request data
+    """
+    data = {}
+    if 'query' in params:
+        data['query'] = params['query']
+    for name in ('variables', 'extensions'):
+        if params.get(name):
+            data[name] = loads(params[name])
+    if params.get('operationName'):
+        data['operationName'] = params['operationName']
+    return data
+
+
+# The GraphQLRequest class holds a parsed and validated request whose cost is within the limits, with what is needed
+# to cache its response.
+class GraphQLRequest:
+    def __init__(self, data):
+        source, self.variables = get_operation(data)
+        self.operation_name = data.get('operationName')
+        self.document, self.errors, self.normalized = get_document(source)
+        if not self.errors:
+            self.errors = check_cost(schema.graphql_schema, self.document, self.operation_name, self.variables)
+        operation = get_operation_ast(self.document, self.operation_name) if self.document else None
+        self.is_query = operation is not None and operation.operation == OperationType.QUERY
+        self.operation_type = operation.operation.value if operation is not None else "unknown"
+        # The label comes from the parsed document, never from the operationName sent by the client
+        self.label = operation.name.value if operation is not None and operation.name else "anonymous"
+
+    def cache_key(self):
+        """
+        It returns the key of the response in the response cache, which the ETag of the response is built from. It
+        changes whenever the dataset version changes, so edited countries are never served from a stale entry.
+        """
+        key = json.dumps([country_cache.version, self.normalized, self.variables, self.operation_name], sort_keys=True)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+    def etag(self, ndjson=False):
+        """
+        It returns the ETag of the response, which tells the JSON and the streamed NDJSON representations apart
+
+        :param ndjson: Whether the response is streamed as newline-delimited JSON
+        """
+        return self.cache_key() + ('-ndjson' if ndjson else '')
+
+    def cached_response(self):
+        """
+        It returns the cached status and media of the response, or None
+        """
+        return response_cache.get(self.cache_key()) if self.is_query and not self.errors else None
+
+    def store_response(self, status, media):
+        """
+        It caches a successful query response and returns its key
+        """
+        key = self.cache_key()
+        if self.is_query and "errors" not in (media or {}):
+            response_cache.set(key, (status, media))
+        return key
+
+    def start_metrics(self, tracing):
+        """
+        It makes the metrics of this request the current ones, so the resolvers and the MongoDB listener report to them
+
+        :param tracing: Whether the response should carry the tracing extension
+        :return: A tuple of the RequestMetrics and the token restoring the previous ones
+        """
+        metrics = RequestMetrics(tracing)
+        return metrics, current_request.set(metrics)
+
+    def finish_metrics(self, metrics, token, status, media):
+        """
+        It records the latency of the operation and adds the tracing extension to the response when it was requested
+
+        :return: A tuple of the falcon status and the response media
+        """
+        current_request.reset(token)
+        operation_duration.observe(time.perf_counter() - metrics.started, self.operation_type, self.label)
+        tracing = metrics.finish()
+        if tracing is not None:
+            media = dict(media or {}, extensions={"tracing": tracing})
+        return status, media
+
+
+@functools.lru_cache(maxsize=None)
+def direct_fields(graphql_schema):
+    """
+    It finds the fields graphene resolves with its default resolver that take no arguments and return a scalar, an
+    enum or a list of them
+
+    :param graphql_schema: The GraphQLSchema to inspect
+    :return: A dict mapping (type name, field name) to the key the field is read from and its default value
+    """
+    fields = {}
+    for type_name, graphql_type in graphql_schema.type_map.items():
+        if not is_object_type(graphql_type):
+            continue
+        for field_name, field in graphql_type.fields.items():
+            resolve = field.resolve
+            if isinstance(resolve, functools.partial) and resolve.func in (dict_or_attr_resolver, dict_resolver) \
+                    and not field.args and is_leaf_type(get_named_type(field.type)):
+                fields[(type_name, field_name)] = resolve.args
+    return fields
+
+
+# The DirectFieldExecutionContext class reads the fields found by direct_fields straight from dict sources, such as
+# the cached country rows, instead of building a GraphQLResolveInfo and calling graphene's default resolver for each
+# field of each row. The values are still serialized by their type, and any error falls back to the regular path so
+# it is reported the same way. It is bypassed when METRICS_ALL_FIELDS asks the middleware to time every field.
+class DirectFieldExecutionContext(ExecutionContext):
+    def execute_field(self, parent_type, source, field_nodes, path):
+        direct = direct_fields(self.schema).get((parent_type.name, field_nodes[0].name.value)) \
+            if isinstance(source, dict) else None
+        if direct is None:
+            return super().execute_field(parent_type, source, field_nodes, path)
+        try:
+            return_type = parent_type.fields[field_nodes[0].name.value].type
+            return self.complete_value(return_type, field_nodes, None, path, source.get(*direct))
+        except Exception:
+            return super().execute_field(parent_type, source, field_nodes, path)
+
+
+EXECUTION_CONTEXT = ExecutionContext if METRICS_ALL_FIELDS else DirectFieldExecutionContext
+
+
+def execute(data, tracing=False):
+    """
+    It runs the GraphQL operation of the request synchronously, serving query operations from the response cache
+    when possible
+
+    :param data: The decoded JSON body of the request, or a GraphQLRequest
+    :param tracing: Whether to add the tracing extension to the response, which also bypasses the response cache
+    :return: A tuple of the falcon status and the response media
+    """
+    request = data if isinstance(data, GraphQLRequest) else GraphQLRequest(data)
+    if request.errors:
+        return format_result(ExecutionResult(data=None, errors=request.errors))
+    cached = None if tracing else request.cached_response()
+    if cached is not None:
+        return cached
+    metrics, token = request.start_metrics(tracing)
+    try:
+        result = execute_document(
+            schema.graphql_schema, request.document, variable_values=request.variables,
+            operation_name=request.operation_name, context_value={}, middleware=[timing_middleware],
+            execution_context_class=EXECUTION_CONTEXT)
+        status, media = format_result(result)
+    except BaseException:
+        current_request.reset(token)
+        raise
+    request.store_response(status, media)
+    return request.finish_metrics(metrics, token, status, media)
+
+
+# The ThreadOffloadMiddleware class runs the resolvers of the top-level fields in a thread pool, so the blocking
+# pymongo calls behind them do not stall the event loop. Nested fields only read attributes and stay on the loop.
+# The resolvers run in a copy of the request context, so the MongoDB commands they send count towards the request.
+class ThreadOffloadMiddleware:
+    def __init__(self, max_workers=RESOLVER_THREADS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resolver")
+
+    def resolve(self, next, root, info, **args):
+        if info.path.prev is not None:
+            return next(root, info, **args)
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return loop.run_in_executor(self.executor, functools.partial(context.run, next, root, info, **args))
+
+
+thread_offload_middleware = ThreadOffloadMiddleware()
+
+
+async def execute_async(data, tracing=False):
+    """
+    It runs the GraphQL operation of the request on the event loop, with the top-level resolvers offloaded to threads,
+    serving query operations from the response cache when possible
+
+    :param data: The decoded JSON body of the request, or a GraphQLRequest
+    :param tracing: Whether to add the tracing extension to the response, which also bypasses the response cache
+    :return: A tuple of the falcon status and the response media
+    """
+    request = data if isinstance(data, GraphQLRequest) else GraphQLRequest(data)
+    if request.errors:
+        return format_result(ExecutionResult(data=None, errors=request.errors))
+    cached = None if tracing else request.cached_response()
+    if cached is not None:
+        return cached
+    metrics, token = request.start_metrics(tracing)
+    try:
+        # The timing middleware comes first so it wraps the resolver inside the worker thread
+        result = execute_document(
+            schema.graphql_schema, request.document, variable_values=request.variables,
+            operation_name=request.operation_name, context_value={},
+            middleware=[timing_middleware, thread_offload_middleware], execution_context_class=EXECUTION_CONTEXT)
+        if isawaitable(result):
+            result = await result
+        status, media = format_result(result)
+    except BaseException:
+        current_request.reset(token)
+        raise
+    request.store_response(status, media)
+    return request.finish_metrics(metrics, token, status, media)
+
+
+def get_stats():
+    """
+    It collects the counters of every in-process cache
+
+    :return: A dictionary of cache name to counters
+    """
+    return {
+        "countryCache": country_cache.stats(),
+        "documentCache": document_cache.stats(),
+        "persistedQueries": persisted_queries.stats(),
+        "responseCache": response_cache.stats(),
+    }
+
+
+def get_metrics():
+    """
+    It renders the latency histograms, the MongoDB counters and the counters of every in-process cache in the
+    Prometheus text format
+
+    :return: The text of the /metrics endpoint
+    """
+    caches = {
+        "country_rows": country_cache.rows, "country_snapshot": country_cache.snapshot, "document": document_cache,
+        "persisted_query": persisted_queries, "response": response_cache,
+    }
+    hits = Counter("cache_hits_total", "Lookups answered by an in-process cache.", ("cache",))
+    misses = Counter("cache_misses_total", "Lookups missed by an in-process cache.", ("cache",))
+    evictions = Counter("cache_evictions_total", "Entries evicted or expired from an in-process cache.", ("cache",))
+    size = Gauge("cache_size", "Entries held by an in-process cache.", ("cache",))
+    for name, cache in caches.items():
+        stats = cache.stats()
+        hits.inc(name, amount=stats["hits"])
+        misses.inc(name, amount=stats["misses"])
+        evictions.inc(name, amount=stats["evictions"])
+        size.set(name, value=stats["size"])
+    return render_metrics([hits, misses, evictions, size])
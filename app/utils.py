@@ -1,17 +1,37 @@
-import requests, math, os
-from mongoengine import connect, disconnect
+import requests, os, json, base64, time, threading
+from bson import json_util
+from itertools import islice
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from bson.errors import InvalidId
+from graphql import GraphQLError, FragmentDefinitionNode, FragmentSpreadNode, InlineFragmentNode
 from mongoengine.errors import ValidationError
-from dotenv import load_dotenv
 
 try:
     from schemas import Country
+    from indexes import spatial_index, language_index, continent_stats, language_stats
+    from cache import country_cache
+    from managers import MongoDBConnection, init_connection, close_connection
 except ModuleNotFoundError:
     from .schemas import Country
+    from .indexes import spatial_index, language_index, continent_stats, language_stats
+    from .cache import country_cache
+    from .managers import MongoDBConnection, init_connection, close_connection
 
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 500))
+MAX_NEARBY_BATCH_POINTS = int(os.getenv('MAX_NEARBY_BATCH_POINTS', 10000))
+MAX_BULK_EDIT_SIZE = int(os.getenv('MAX_BULK_EDIT_SIZE', 1000))
+# Age in seconds after which the spatial and language indexes and the summaries are rebuilt from the database, to pick
+# up writes made by other processes. Edits made by this process are applied to them right away. 0 never rebuilds them.
+INDEX_REFRESH_SECONDS = float(os.getenv('INDEX_REFRESH_SECONDS', 300))
 
-load_dotenv()
-
-DB_CONNECTION_STRING = os.getenv('DB_CONNECTION_STRING', 'mongodb://127.0.0.1:27017/countries_db')
+# Only one request rebuilds the indexes at a time
+_index_lock = threading.Lock()
+# Serializes index updates with the end of a rebuild, see load_indexes
+_index_edits_lock = threading.Lock()
+_index_state = {"built_at": None, "pending": None}
 
 def fetch_countries():
     """
@@ -38,7 +58,7 @@ def clean_data(item):
     value that indicates whether the data is clean or not.
     """
     cleaned_data, is_clean = None, False
-    key_list = ['name', 'independent', 'status', 'status', 'unMember', 
+    key_list = ['cca3', 'name', 'independent', 'status', 'status', 'unMember', 
                 'currencies', 'capital', 'languages', 'latlng', 'flag', 
                 'maps', 'population', 'timezones', 'continents']
 
@@ -47,79 +67,615 @@ def clean_data(item):
         is_clean = True
     return cleaned_data, is_clean
 
-def add_collections(data):
+def load_countries_file(path):
+    """
+    It reads a country list saved from the REST API endpoint, so the data can be imported without network access
+    
+    :param path: The path of the JSON file
+    :return: A list of dictionaries
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def iter_batches(iterable, size):
+    """
+    It splits an iterable into lists of at most size items, without reading the whole iterable first
+    """
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+def build_upserts(batch):
+    """
+    It cleans and validates a batch of countries and turns the valid ones into upserts keyed on the cca3 code
+    
+    :param batch: A list of dictionaries from the REST API
+    :return: A tuple of the list of UpdateOne operations and the number of skipped countries
+    """
+    operations, skipped = [], 0
+    for item in batch:
+        cleaned_data, is_clean = clean_data(item)
+        if not is_clean:
+            skipped += 1
+            continue
+        country = Country(**cleaned_data)
+        try:
+            country.validate()
+        except ValidationError as e:
+            print(e)
+            skipped += 1
+            continue
+        document = country.to_mongo().to_dict()
+        document.pop('_id', None)
+        operations.append(UpdateOne({'cca3': document['cca3']}, {'$set': document}, upsert=True))
+    return operations, skipped
+
+def migrate_legacy_countries(collection, batch):
+    """
+    It migrates the countries stored before the import was keyed on the cca3 code. For each country of the batch, the
+    oldest stored copy without a cca3 code, matched on the common name, gets the code, so that the upsert updates it
+    instead of inserting a duplicate. The other copies left by earlier imports are deleted, and so are all of them when
+    a copy with the code already exists.
+    
+    :param collection: The country collection
+    :param batch: A list of dictionaries from the REST API
+    :return: A tuple of the number of migrated and deleted countries
+    """
+    codes = {}
+    for item in batch:
+        name = item.get('name')
+        if item.get('cca3') and isinstance(name, dict) and name.get('common'):
+            codes[name['common']] = item['cca3']
+    legacy = {}
+    for item in collection.find({'cca3': {'$exists': False}, 'name.common': {'$in': list(codes)}}, {'name.common': 1}):
+        legacy.setdefault(item['name']['common'], []).append(item['_id'])
+    if not legacy:
+        return 0, 0
+    existing = set(collection.distinct('cca3', {'cca3': {'$in': [codes[name] for name in legacy]}}))
+    backfills, duplicates = [], []
+    for name, document_ids in legacy.items():
+        document_ids.sort()
+        if codes[name] in existing:
+            duplicates.extend(document_ids)
+        else:
+            backfills.append(UpdateOne({'_id': document_ids[0]}, {'$set': {'cca3': codes[name]}}))
+            duplicates.extend(document_ids[1:])
+    if backfills:
+        collection.bulk_write(backfills, ordered=False)
+    if duplicates:
+        collection.delete_many({'_id': {'$in': duplicates}})
+    return len(backfills), len(duplicates)
+
+def add_collections(data, batch_size=INGEST_BATCH_SIZE):
     """
-    It takes a list of dictionaries as an argument, connects to MongoDB, cleans the data, validates it, and saves it to the
-    database
+    It takes an iterable of dictionaries as an argument, connects to MongoDB, cleans and validates the data in
+    batches, and upserts every batch with a single bulk_write keyed on the cca3 code, so running it again updates the
+    existing countries instead of duplicating them. Countries imported before the cca3 code was stored are migrated
+    first, see migrate_legacy_countries.
     
     :param data: The data to be added to the database
+    :param batch_size: The number of countries written per bulk_write
+    :return: A dictionary with the inserted, updated, unchanged, skipped, migrated and deleted counts and the elapsed
+    seconds
     """
+    report = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "migrated": 0, "deleted": 0, "seconds": 0.0}
     if data:
+        started = time.perf_counter()
         print("Creating MongoDB connection")
-        connect(host=DB_CONNECTION_STRING)
-        for item in data:
-            cleaned_data, is_clean = clean_data(item)
-            if is_clean:
-                country = Country(**cleaned_data)
-                try:
-                    country.clean()
-                    country.save()
-                except ValidationError as e:
-                    print(e)
+        init_connection()
+        collection = Country._get_collection()
+        has_legacy = collection.find_one({'cca3': {'$exists': False}}, {'_id': 1}) is not None
+        for batch in iter_batches(data, batch_size):
+            if has_legacy:
+                migrated, deleted = migrate_legacy_countries(collection, batch)
+                report["migrated"] += migrated
+                report["deleted"] += deleted
+            operations, skipped = build_upserts(batch)
+            report["skipped"] += skipped
+            if operations:
+                result = collection.bulk_write(operations, ordered=False)
+                report["inserted"] += result.upserted_count
+                report["updated"] += result.modified_count
+                report["unchanged"] += result.matched_count - result.modified_count
+        report["seconds"] = round(time.perf_counter() - started, 3)
         print("Colletion added to DB")
-        disconnect()
+        close_connection()
         print("Disconnecting MongoDB connection")
+    return report
 
         
-#Function to insert data collected from Countries REST API into MongoDB
-def insert_data_into_db():
+#Function to insert data collected from Countries REST API, or from a local copy of it, into MongoDB
+def insert_data_into_db(path=None, batch_size=INGEST_BATCH_SIZE):
     """
-    It fetches data from an API and inserts it into a database
+    It fetches data from an API, or reads it from a JSON file when a path is given, and inserts it into a database
+    
+    :param path: Optional path of a JSON file holding the REST API response
+    :param batch_size: The number of countries written per bulk_write
+    :return: The report returned by add_collections
     """
-    print("Please wait fetching country list")
-    countries_data = fetch_countries()
+    if path:
+        print("Reading country list from {0}".format(path))
+        countries_data = load_countries_file(path)
+    else:
+        print("Please wait fetching country list")
+        countries_data = fetch_countries()
     print("Country list fetched successfully.")
-    add_collections(countries_data)
+    report = add_collections(countries_data, batch_size)
+    print("Inserted: {inserted}, updated: {updated}, unchanged: {unchanged}, skipped: {skipped}, migrated: {migrated}, "
+          "deleted duplicates: {deleted} in {seconds}s".format(**report))
+    return report
+
+# Mongo paths holding the value of each CountryType field, used to build projections from the GraphQL selection set
+FIELD_PATHS = {
+    "id": "_id",
+    "name": "name.common",
+    "independent": "independent",
+    "status": "status",
+    "unMember": "unMember",
+    "currencies": "currencies",
+    "capital": "capital",
+    "languages": "languages",
+    "latlng": "latlng",
+    "flag": "flag",
+    "maps": "maps",
+    "population": "population",
+    "timezones": "timezones",
+    "continents": "continents",
+}
+PLAIN_FIELDS = [field for field, path in FIELD_PATHS.items() if field == path and field != "currencies"]
+
+def decode_country(item):
+    """
+    It converts a raw country document into the flat dictionary used to build the GraphQL country types. Fields left
+    out of a projected document are left out of the dictionary as well.
+    
+    :param item: The country document as returned by pymongo
+    :return: A dictionary with one key per CountryType field
+    """
+    row = {"id": str(item["_id"])}
+    if "name" in item:
+        row["name"] = item["name"].get("common")
+    if "currencies" in item:
+        row["currencies"] = next(iter(item["currencies"]), None)
+        # countriesByLanguageQuery returns the whole currencies dictionary instead of the first code
+        row["currencyDetails"] = item["currencies"]
+    for field in PLAIN_FIELDS:
+        if field in item:
+            row[field] = item[field]
+    return row
+
+def collect_fields(info, field_nodes=None):
+    """
+    It groups the fields selected under the given field nodes by name, following fragments
+    
+    :param info: The GraphQLResolveInfo of the resolver
+    :param field_nodes: The field nodes to read, defaults to the nodes of the current field
+    :return: A dictionary of field name to the list of selected FieldNodes
+    """
+    if field_nodes is None:
+        field_nodes = info.field_nodes
+    fields = {}
+    selections = [
+        selection for node in field_nodes if node.selection_set
+        for selection in node.selection_set.selections
+    ]
+    while selections:
+        node = selections.pop()
+        if isinstance(node, FragmentSpreadNode):
+            node = info.fragments.get(node.name.value)
+            if node is None:
+                continue
+        if isinstance(node, (FragmentDefinitionNode, InlineFragmentNode)):
+            selections.extend(node.selection_set.selections)
+        else:
+            fields.setdefault(node.name.value, []).append(node)
+    return fields
+
+def get_projection(info, field_nodes=None):
+    """
+    It reads the fields requested under the current GraphQL field and converts them into a Mongo find projection
+    
+    :param info: The GraphQLResolveInfo of the resolver
+    :param field_nodes: The field nodes to read, defaults to the nodes of the current field
+    :return: A dictionary of Mongo path to 1
+    """
+    projection = {"_id": 1}
+    for name in collect_fields(info, field_nodes):
+        if name in FIELD_PATHS:
+            projection[FIELD_PATHS[name]] = 1
+    return projection
+
+def load_countries():
+    """
+    It reads every country from the database and decodes them
+    
+    :return: A list of decoded countries
+    """
+    with MongoDBConnection() as db_conn:
+        return [decode_country(item) for item in db_conn['country'].find()]
+
+def load_indexes():
+    """
+    It rebuilds the indexes and the summaries from the database. Countries edited by this process while the collection
+    is read are recorded by refresh_row and replayed over the rows that were read, so a rebuild never brings back the
+    values an edit replaced.
+    """
+    with _index_edits_lock:
+        _index_state["pending"] = {}
+    try:
+        rows = load_countries()
+    except Exception:
+        with _index_edits_lock:
+            _index_state["pending"] = None
+        raise
+    with _index_edits_lock:
+        pending, _index_state["pending"] = _index_state["pending"], None
+        rows = [pending.pop(row["id"], row) for row in rows] + list(pending.values())
+        build_indexes(rows)
+        _index_state["built_at"] = time.monotonic()
+        country_cache.reset_version(rows)
+
+def ensure_indexes_loaded():
+    """
+    It builds the indexes on first use and rebuilds them once they are INDEX_REFRESH_SECONDS old. Requests arriving
+    during a rebuild keep reading the current indexes instead of waiting or rebuilding them as well.
+    """
+    built_at = _index_state["built_at"]
+    if built_at is None:
+        with _index_lock:
+            if _index_state["built_at"] is None:
+                load_indexes()
+    elif 0 < INDEX_REFRESH_SECONDS <= time.monotonic() - built_at and _index_lock.acquire(blocking=False):
+        try:
+            if INDEX_REFRESH_SECONDS <= time.monotonic() - _index_state["built_at"]:
+                load_indexes()
+        finally:
+            _index_lock.release()
+
+def build_indexes(rows):
+    """
+    It rebuilds the spatial and language indexes and the continent and language summaries from a list of decoded
+    countries
+    """
+    spatial_index.build(
+        (row["id"], row["latlng"][0], row["latlng"][1], row) for row in rows if len(row.get("latlng", ())) >= 2)
+    language_index.build((row["id"], row.get("languages", ()), row) for row in rows)
+    continent_stats.build(
+        (row["id"], row.get("continents"), row.get("population"), row.get("unMember")) for row in rows)
+    language_stats.build(
+        (row["id"], row.get("languages"), row.get("population"), row.get("unMember")) for row in rows)
+
+def load_countries_page(projection=None, skip=0, limit=0):
+    """
+    It reads and decodes a page of countries from the database, transferring only the projected fields
+    
+    :param projection: The Mongo projection, all the fields are read when it is None
+    :param skip: The number of countries to skip
+    :param limit: The maximum number of countries to read, 0 for no limit
+    :return: A list of decoded countries
+    """
+    with MongoDBConnection() as db_conn:
+        items = db_conn['country'].find({}, projection, skip=skip, limit=limit)
+        return [decode_country(item) for item in items]
+
+def load_countries_by_ids(country_ids, projection=None):
+    """
+    It reads and decodes several countries from the database with a single $in query
+    
+    :param country_ids: The ids of the countries
+    :param projection: The Mongo projection, all the fields are read when it is None
+    :return: A dictionary of id to decoded country, ids that are invalid or do not exist are left out
+    """
+    document_ids = []
+    for country_id in country_ids:
+        try:
+            document_ids.append(ObjectId(country_id))
+        except (InvalidId, TypeError):
+            pass
+    if not document_ids:
+        return {}
+    with MongoDBConnection() as db_conn:
+        items = db_conn['country'].find({'_id': {'$in': document_ids}}, projection)
+        rows = [decode_country(item) for item in items]
+    return {row["id"]: row for row in rows}
+
+def get_countries():
+    """
+    It returns every decoded country, served from the country cache when possible
+    """
+    return country_cache.get_all(load_countries)
+
+def get_countries_page(page=None, limit=None, projection=None):
+    """
+    It returns a page of decoded countries. With the country cache enabled the page is sliced from the cached
+    snapshot, otherwise the page and the projection are pushed down to the database query.
+    
+    :param page: The page number, starting at 1
+    :param limit: The number of countries per page
+    :param projection: The Mongo projection used when the cache is disabled
+    :return: A list of decoded countries
+    """
+    start = end = None
+    if page and limit:
+        start = (page - 1) * limit
+        end = start + limit
+    if country_cache.enabled:
+        return get_countries()[start:end]
+    return load_countries_page(projection, start or 0, limit if end else 0)
+
+def get_path(item, path):
+    """
+    It reads a dotted Mongo path such as name.common from a raw document, returning None when a part is missing
+    """
+    value = item
+    for key in path.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+def encode_cursor(sort_value, country_id):
+    """
+    It builds an opaque cursor from the sort value and the id of the last country of a page
+    """
+    return base64.urlsafe_b64encode(json.dumps([sort_value, country_id]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    It reads back the sort value and the id stored in a cursor built by encode_cursor
+    
+    :return: A tuple of the sort value and the ObjectId of the country
+    """
+    try:
+        sort_value, country_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return sort_value, ObjectId(country_id)
+    except (ValueError, TypeError, InvalidId):
+        raise GraphQLError("Invalid cursor: {0}".format(cursor))
+
+def get_countries_connection(first=None, after=None, sort_by="_id", descending=False, filters=None,
+                             projection=None, with_total=False):
+    """
+    It reads a page of countries in a stable order using keyset pagination: instead of skipping the previous pages,
+    the query starts right after the (sort value, _id) pair stored in the cursor, so deep pages cost the same as the
+    first one when the sort field is indexed.
+    
+    :param first: The number of countries to return, capped by MAX_PAGE_SIZE
+    :param after: The cursor of the last country of the previous page
+    :param sort_by: The Mongo path to sort on
+    :param descending: Sort from the highest to the lowest value
+    :param filters: A Mongo filter applied before paging
+    :param projection: The Mongo projection, all the fields are read when it is None
+    :param with_total: Also count the countries matching the filters
+    :return: A tuple of the list of (cursor, decoded country), whether there is a next page, and the total or None
+    """
+    first = MAX_PAGE_SIZE if first is None else max(0, min(first, MAX_PAGE_SIZE))
+    filters = dict(filters or {})
+    query = dict(filters)
+    comparison = '$lt' if descending else '$gt'
+    if after:
+        sort_value, document_id = decode_cursor(after)
+        if sort_by == "_id":
+            query['_id'] = {comparison: document_id}
+        else:
+            keyset = {'$or': [{sort_by: {comparison: sort_value}}, {sort_by: sort_value, '_id': {comparison: document_id}}]}
+            query = {'$and': [filters, keyset]} if filters else keyset
+    if projection is not None:
+        projection = dict(projection, **{sort_by: 1})
+    direction = -1 if descending else 1
+    with MongoDBConnection() as db_conn:
+        collection = db_conn['country']
+        items = list(collection.find(query, projection, sort=[(sort_by, direction), ('_id', direction)], limit=first + 1))
+        total = collection.count_documents(filters) if with_total else None
+    has_next_page = len(items) > first
+    edges = []
+    for item in items[:first]:
+        sort_value = str(item["_id"]) if sort_by == "_id" else get_path(item, sort_by)
+        edges.append((encode_cursor(sort_value, str(item["_id"])), decode_country(item)))
+    return edges, has_next_page, total
+
+def get_countries_by_ids(country_ids, projection=None):
+    """
+    It returns several decoded countries. With the country cache enabled the ones missing from the cache are fetched
+    in one database query, otherwise they are all fetched with the projection.
+    
+    :return: A dictionary of id to decoded country
+    """
+    country_ids = [str(country_id) for country_id in country_ids]
+    if country_cache.enabled:
+        return country_cache.get_many(country_ids, load_countries_by_ids)
+    return load_countries_by_ids(country_ids, projection)
+
+def refresh_country(country):
+    """
+    It refreshes the cached copy and the index entries of a country after it was written to the database
+    
+    :param country: the saved Country document
+    """
+    refresh_row(decode_country(country.to_mongo()))
 
-def get_distance(country, input_lat, input_lng):
+def refresh_row(row):
     """
-    It calculates the distance between two points on the Earth's surface, given their latitude and longitude
+    It replaces a decoded country in the country cache, in the spatial and language indexes and in the continent and
+    language summaries
     
-    :param country: the country object from the list of countries
-    :param input_lat: The latitude of the input location
-    :param input_lng: The longitude of the point you want to find the closest country to
-    :return: The distance between the inputted coordinates and the country's coordinates.
+    :param row: the decoded country
     """
-    country_lat = country["latlng"][0]
-    country_lng = country["latlng"][1]
-    d_lat = math.radians(country_lat - input_lat)
-    d_lng = math.radians(country_lng - input_lng)
-    a = math.sin(d_lat / 2) ** 2 + math.cos(math.radians(input_lat)) * math.cos(math.radians(country_lat)) * math.sin(d_lng / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = 6371 * c
-    return distance
+    with _index_edits_lock:
+        country_cache.refresh(row)
+        if _index_state["pending"] is not None:
+            _index_state["pending"][row["id"]] = row
+        if spatial_index.loaded:
+            if len(row.get("latlng", ())) >= 2:
+                spatial_index.update(row["id"], row["latlng"][0], row["latlng"][1], row)
+            else:
+                spatial_index.remove(row["id"])
+        if language_index.loaded:
+            language_index.update(row["id"], row.get("languages", ()), row)
+        if continent_stats.loaded:
+            continent_stats.update(row["id"], row.get("continents"), row.get("population"), row.get("unMember"))
+        if language_stats.loaded:
+            language_stats.update(row["id"], row.get("languages"), row.get("population"), row.get("unMember"))
 
-def get_nearest_countries(input_lat, input_lng):
+def build_country_update(country_id, patch):
     """
-    It connects to the MongoDB database, and then uses the Country model to find the nearest countries to the input
-    latitude and longitude
+    It validates a partial update of a country and turns it into a single $set/$unset operation, so that only the
+    patched fields are written and the document does not have to be read first
+    
+    :param country_id: The id of the country
+    :param patch: A dictionary of field name to new value, a None value removes the field
+    :return: An UpdateOne operation, or None when the patch is empty and the country is only read back
+    """
+    document_id = ObjectId(country_id)
+    updates = {}
+    for key, value in patch.items():
+        field = Country._fields.get(key)
+        if field is None or key in ('id', 'cca3'):
+            raise ValidationError("Field {0} cannot be edited".format(key))
+        if value is None:
+            updates.setdefault('$unset', {})[key] = ""
+            continue
+        try:
+            field.validate(value)
+        except ValidationError as e:
+            raise ValidationError("{0}: {1}".format(key, e))
+        updates.setdefault('$set', {})[key] = field.to_mongo(value)
+    if not updates:
+        return None
+    return UpdateOne({'_id': document_id}, updates)
+
+def edit_countries(edits):
+    """
+    It applies partial updates to several countries with a single unordered bulk_write, re-reads the edited countries
+    with one $in query and refreshes their cached copies and index entries. An empty patch writes nothing and returns
+    the current country.
+    
+    :param edits: A list of (country id, patch) tuples
+    :return: A tuple of the list of (country id, saved Country or None, error message or None) in the order of the
+    edits, the number of matched countries and the number of modified countries
+    """
+    if len(edits) > MAX_BULK_EDIT_SIZE:
+        raise GraphQLError("At most {0} countries can be edited at once".format(MAX_BULK_EDIT_SIZE))
+    errors, operations, positions, reads = {}, [], [], []
+    for position, (country_id, patch) in enumerate(edits):
+        try:
+            operation = build_country_update(country_id, patch)
+            if operation is None:
+                reads.append(position)
+            else:
+                operations.append(operation)
+                positions.append(position)
+        except (InvalidId, TypeError):
+            errors[position] = "Invalid country id {0}".format(country_id)
+        except ValidationError as e:
+            errors[position] = str(e)
+    matched = modified = 0
+    if operations:
+        init_connection()
+        collection = Country._get_collection()
+        try:
+            result = collection.bulk_write(operations, ordered=False)
+            matched, modified = result.matched_count, result.modified_count
+        except BulkWriteError as e:
+            matched, modified = e.details.get('nMatched', 0), e.details.get('nModified', 0)
+            for write_error in e.details.get('writeErrors', []):
+                errors[positions[write_error['index']]] = write_error.get('errmsg', "Write failed")
+    written = [edits[position][0] for position in positions + reads if position not in errors]
+    countries = {}
+    if written:
+        init_connection()
+        items = Country._get_collection().find({'_id': {'$in': [ObjectId(country_id) for country_id in written]}})
+        for item in items:
+            country = Country._from_son(item)
+            refresh_country(country)
+            countries[str(country.id)] = country
+    results = []
+    for position, (country_id, _) in enumerate(edits):
+        error = errors.get(position)
+        # A sibling edit of the same country may have been saved, but it is not the outcome of this one
+        country = countries.get(str(country_id)) if error is None else None
+        if error is None and country is None:
+            error = "Country {0} does not exist".format(country_id)
+        results.append((country_id, country, error))
+    return results, matched, modified
+
+def get_nearest_countries(input_lat, input_lng, k=10, max_distance_km=None):
+    """
+    It runs a k-nearest-neighbour lookup against the in-memory spatial index, which is rebuilt every
+    INDEX_REFRESH_SECONDS. The closest match is skipped, as the point of interest usually lies within that country.
     
     :param input_lat: latitude of the point of interest
     :param input_lng: longitude of the point of interest
-    :return: A list of countries with their distance from the input coordinates.
+    :param k: The number of countries to return
+    :param max_distance_km: Optional radius in kilometers
+    :return: A list of (distance, country) tuples sorted by distance.
     """
-    connect(host=DB_CONNECTION_STRING)
-    countries =  list(Country.with_distance(input_lat, input_lng))
-    return countries
+    ensure_indexes_loaded()
+    return spatial_index.nearest(input_lat, input_lng, k + 1, max_distance_km)[1:]
 
-def get_countries_by_language(language):
+def get_nearest_countries_batch(points, k=10, max_distance_km=None):
     """
-    It connects to the database, finds all the countries that have a language that matches the language parameter, and
-    returns the countries
+    It runs the k-nearest-neighbour lookup of get_nearest_countries for many points at once, using one points x
+    countries distance matrix instead of one pass per point
+    
+    :param points: A list of (lat, lng) tuples, at most MAX_NEARBY_BATCH_POINTS
+    :param k: The number of countries to return per point
+    :param max_distance_km: Optional radius in kilometers
+    :return: A list holding, for each point, a list of (distance, country) tuples sorted by distance.
+    """
+    if len(points) > MAX_NEARBY_BATCH_POINTS:
+        raise GraphQLError("At most {0} points can be sent in one batch".format(MAX_NEARBY_BATCH_POINTS))
+    ensure_indexes_loaded()
+    return [countries[1:] for countries in spatial_index.nearest_many(points, k + 1, max_distance_km)]
+
+def get_countries_by_language(language, prefix=False):
+    """
+    It looks up the countries that speak the given language in the language index, ignoring case. The index is
+    rebuilt every INDEX_REFRESH_SECONDS.
     
     :param language: The language you want to search for
+    :param prefix: Match every language starting with the given text
     :return: A list of countries that have the language in their languages list.
     """
-    connect(host=DB_CONNECTION_STRING)
-    countries = Country.objects(languages__in=[language])
-    return countries
\ No newline at end of file
+    ensure_indexes_loaded()
+    return language_index.lookup(language, prefix)
+
+def get_continent_stats(continent=None):
+    """
+    It reads the population and UN membership summaries of the continents, which are kept up to date on every edit
+    instead of being recomputed from the countries
+    
+    :param continent: Only return this continent
+    :return: A list of summaries sorted by continent name
+    """
+    ensure_indexes_loaded()
+    return continent_stats.summaries(continent)
+
+def get_language_stats(language=None):
+    """
+    It reads the population and UN membership summaries of the languages, kept up to date like the continent ones
+    
+    :param language: Only return this language, ignoring case
+    :return: A list of summaries sorted by language name
+    """
+    ensure_indexes_loaded()
+    return language_stats.summaries(language)
+
+def export_snapshot(path):
+    """
+    It writes every raw country document to a JSON file, which the memory backend can serve without a database
+    
+    :param path: The path of the JSON file
+    :return: The number of countries written
+    """
+    with MongoDBConnection() as db_conn:
+        documents = list(db_conn['country'].find())
+    with open(path, 'w') as f:
+        f.write(json_util.dumps(documents))
+    return len(documents)
+
+def ensure_indexes():
+    """
+    It creates the MongoDB indexes declared on the Country document if they do not exist yet
+    """
+    init_connection()
+    Country.ensure_indexes()
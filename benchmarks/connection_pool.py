@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from managers import DB_CONNECTION_STRING, DB_NAME, MongoDBConnection, close_connection
+
+#Benchmark comparing a new MongoClient per request against the shared connection pool.
+#Requires a running MongoDB populated by db_script.py.
+
+
+def per_request_client():
+    """
+    It reproduces the previous behaviour: a new client, a full handshake and a close for every request
+    """
+    client = MongoClient(host=DB_CONNECTION_STRING)
+    try:
+        client[DB_NAME]["country"].find_one()
+    finally:
+        client.close()
+
+
+def pooled_client():
+    """
+    It runs the same lookup through the shared connection pool
+    """
+    with MongoDBConnection() as db_conn:
+        db_conn["country"].find_one()
+
+
+def run(func, requests, concurrency):
+    """
+    It calls the function the given number of times from a thread pool and returns the throughput in requests/sec
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda _: func(), range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    before = run(per_request_client, args.requests, args.concurrency)
+    pooled_client()
+    after = run(pooled_client, args.requests, args.concurrency)
+    close_connection()
+    print("per-request client: {0:10.1f} req/s".format(before))
+    print("shared pool:        {0:10.1f} req/s".format(after))
+    print("speed-up:           {0:10.1f}x".format(after / before))
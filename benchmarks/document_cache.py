@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import argparse
+from graphql import parse, validate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from service import schema, get_document, document_cache
+
+#Microbenchmark of the per-request cost of parsing and validating the documents our clients send, against the
+#cached lookup done by service.get_document. No database is needed.
+
+OPERATIONS = {
+    "countriesQuery": "{ countriesQuery(page: 1, limit: 20) { id name flag languages population } }",
+    "countryQuery": 'query Country($id: ID!) { countryQuery(id: $id) { id name capital currencies maps } }',
+    "countriesNearbyQuery": "{ countriesNearbyQuery(lat: 48.85, lng: 2.35) { id name distance } }",
+    "countriesByLanguageQuery": '{ countriesByLanguageQuery(language: "French") { id name languages } }',
+}
+
+
+def parse_and_validate(source):
+    document = parse(source)
+    validate(schema.graphql_schema, document)
+
+
+def timed(func, source, iterations):
+    """
+    It returns the average time of a call in microseconds
+    """
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(source)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    print("{0:<26} {1:>14} {2:>14}".format("operation", "uncached (us)", "cached (us)"))
+    for name, source in OPERATIONS.items():
+        uncached = timed(parse_and_validate, source, args.iterations)
+        get_document(source)
+        cached = timed(get_document, source, args.iterations)
+        print("{0:<26} {1:>14.1f} {2:>14.1f}".format(name, uncached, cached))
+    print(document_cache.stats())
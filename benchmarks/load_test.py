@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'static', 'json')
+sys.path.insert(0, APP_DIR)
+
+#Load test of the GraphQL endpoint. It seeds the country collection from the static/json fixtures or with a synthetic
+#dataset, drives the WSGI or ASGI app in-process with falcon.testing and reports p50/p95/p99 latency and throughput
+#per operation. The results can be written as JSON and compared with the results of another commit:
+#
+#   python benchmarks/load_test.py --dataset synthetic --countries 100000 --output after.json --compare before.json
+#
+#The default backend is mongomock, so no database is needed. --backend mongod benchmarks the database given by
+#--mongo-uri as it is, and only replaces its countries with the benchmark dataset when --reseed is passed.
+
+OPERATIONS = {
+    "list": "query List($page: Int, $limit: Int) { countriesQuery(page: $page, limit: $limit) { id name languages } }",
+    "by-id": "query Country($id: ID!) { countryQuery(id: $id) { id name status currencies population } }",
+    "nearby": "query Nearby($lat: Float!, $lng: Float!) "
+              "{ countriesNearbyQuery(lat: $lat, lng: $lng) { id name distance } }",
+    "byLanguage": "query Language($language: String!) { countriesByLanguageQuery(language: $language) { id name } }",
+    "edit": "mutation Edit($id: ID!, $population: Int) { countryEditMutation(id: $id, population: $population) "
+            "{ country { id population } } }",
+}
+CONTINENTS = ["Africa", "Antarctica", "Asia", "Europe", "North America", "Oceania", "South America"]
+
+
+def fixture_rows():
+    """
+    It merges the countries found in the static/json responses by id
+    """
+    rows = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        with open(os.path.join(FIXTURES_DIR, name)) as f:
+            for value in json.load(f).values():
+                items = value if isinstance(value, list) else [value.get("country", value)]
+                for item in items:
+                    rows.setdefault(item["id"], {}).update(item)
+    return list(rows.values())
+
+
+def to_document(row, rng):
+    """
+    It turns a fixture row into a stored country, filling the fields the fixtures leave out with random values
+    """
+    name = row.get("name", "Country")
+    currencies = row.get("currencies") or "USD"
+    return {
+        "_id": ObjectId(row["id"]),
+        "name": name if isinstance(name, dict) else {"common": name},
+        "independent": row.get("independent", True),
+        "status": row.get("status", True),
+        "unMember": row.get("unMember", rng.random() < 0.5),
+        "currencies": currencies if isinstance(currencies, dict) else {currencies: {}},
+        "capital": [name if isinstance(name, str) else name.get("common", "")],
+        "languages": row.get("languages") or ["English"],
+        "latlng": [rng.uniform(-60, 70), rng.uniform(-180, 180)],
+        "flag": "",
+        "maps": {},
+        "population": row.get("population", rng.randint(1000, 10 ** 9)),
+        "timezones": ["UTC"],
+        "continents": [rng.choice(CONTINENTS)],
+    }
+
+
+def dataset(kind, countries, rng):
+    """
+    It returns a generator of the stored countries of the benchmark dataset
+
+    :param kind: fixtures for the countries of the static/json responses, synthetic for generated ones
+    :param countries: The number of synthetic countries
+    :param rng: The random generator, seeded so that runs are reproducible
+    """
+    rows = fixture_rows()
+    if kind == "fixtures":
+        for row in rows:
+            yield to_document(row, rng)
+        return
+    languages = sorted({language for row in rows for language in row.get("languages", [])})
+    for i in range(countries):
+        yield to_document({
+            "id": str(ObjectId()),
+            "name": "Country {0}".format(i),
+            "languages": rng.sample(languages, rng.randint(1, 3)),
+        }, rng)
+
+
+def seed(collection, documents, batch_size=10000):
+    """
+    It replaces the countries of the collection with the documents, inserting them in batches
+    """
+    collection.delete_many({})
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def percentile(latencies, value):
+    """
+    It returns the nearest-rank percentile of a sorted list
+    """
+    if not latencies:
+        return None
+    return latencies[min(len(latencies) - 1, max(0, int(round(value / 100 * len(latencies))) - 1))]
+
+
+def run_operation(client, name, variables_for, requests, concurrency, warmup):
+    """
+    It sends the operation the given number of times and measures every request
+
+    :param client: The falcon.testing.TestClient of the app
+    :param name: The key of the operation in OPERATIONS
+    :param variables_for: A function returning the variables of the next request
+    :return: A dictionary with the latency percentiles in milliseconds, the throughput and the error count
+    """
+    def send(variables):
+        started = time.perf_counter()
+        result = client.simulate_post('/graphql', json={"query": OPERATIONS[name], "variables": variables})
+        elapsed = (time.perf_counter() - started) * 1000
+        failed = result.status_code != 200 or "errors" in (result.json or {})
+        return elapsed, failed
+
+    for _ in range(warmup):
+        send(variables_for())
+    payloads = [variables_for() for _ in range(requests)]
+    started = time.perf_counter()
+    if concurrency > 1:
+        # falcon.testing runs ASGI apps on the event loop of the calling thread, so every worker gets its own
+        with ThreadPoolExecutor(max_workers=concurrency,
+                                initializer=lambda: asyncio.set_event_loop(asyncio.new_event_loop())) as executor:
+            measured = list(executor.map(send, payloads))
+    else:
+        measured = [send(payload) for payload in payloads]
+    duration = time.perf_counter() - started
+    latencies = sorted(elapsed for elapsed, _ in measured)
+    return {
+        "requests": requests,
+        "errors": sum(1 for _, failed in measured if failed),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "throughput_rps": round(requests / duration, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results, baseline=None):
+    """
+    It prints one line per operation, with the relative change against the baseline results when given
+    """
+    header = "{0:<12} {1:>9} {2:>9} {3:>9} {4:>11} {5:>7}".format(
+        "operation", "p50 ms", "p95 ms", "p99 ms", "req/s", "errors")
+    print(header + ("  {0:>10} {1:>10}".format("p95 delta", "rps delta") if baseline else ""))
+    for name, stats in results["operations"].items():
+        line = "{0:<12} {p50_ms:>9.2f} {p95_ms:>9.2f} {p99_ms:>9.2f} {throughput_rps:>11.1f} {errors:>7}".format(
+            name, **stats)
+        previous = (baseline or {}).get("operations", {}).get(name)
+        if previous:
+            line += "  {0:>+9.1f}% {1:>+9.1f}%".format(
+                (stats["p95_ms"] / previous["p95_ms"] - 1) * 100 if previous["p95_ms"] else 0.0,
+                (stats["throughput_rps"] / previous["throughput_rps"] - 1) * 100 if previous["throughput_rps"] else 0.0)
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', choices=['fixtures', 'synthetic'], default='fixtures')
+    parser.add_argument('--countries', type=int, default=10000, help="size of the synthetic dataset")
+    parser.add_argument('--backend', choices=['mongomock', 'mongod'], default='mongomock')
+    parser.add_argument('--mongo-uri', default='mongodb://127.0.0.1:27017/countries_db')
+    parser.add_argument('--reseed', action='store_true', help="replace the countries of the mongod database")
+    parser.add_argument('--app', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--operations', default=",".join(OPERATIONS))
+    parser.add_argument('--requests', type=int, default=500, help="measured requests per operation")
+    parser.add_argument('--warmup', type=int, default=20, help="unmeasured requests per operation")
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-response-cache', action='store_true')
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    # The app reads its configuration when it is imported
+    os.environ['DB_CONNECTION_STRING'] = \
+        args.mongo_uri if args.backend == 'mongod' else 'mongodb://localhost/countries_db'
+    if args.no_response_cache:
+        os.environ['RESPONSE_CACHE_SIZE'] = '0'
+
+    import falcon.testing
+    from managers import init_connection
+    from schemas import Country
+
+    rng = random.Random(args.seed)
+    if args.backend == 'mongomock':
+        import mongomock
+        init_connection(mongo_client_class=mongomock.MongoClient)
+    else:
+        init_connection()
+    collection = Country._get_collection()
+    started = time.perf_counter()
+    if args.backend == 'mongomock' or args.reseed:
+        seed(collection, dataset(args.dataset, args.countries, rng))
+    seeded = time.perf_counter() - started
+
+    app_started = time.perf_counter()
+    if args.app == 'asgi':
+        from asgi import app
+    else:
+        from main import app
+    client = falcon.testing.TestClient(app)
+    startup_seconds = time.perf_counter() - app_started
+
+    ids = [str(item["_id"]) for item in collection.find({}, {"_id": 1})]
+    languages = sorted({language for item in collection.find({}, {"languages": 1}).limit(1000)
+                        for language in item.get("languages", [])})
+    pages = max(1, len(ids) // 50)
+    variables = {
+        "list": lambda: {"page": rng.randint(1, pages), "limit": 50},
+        "by-id": lambda: {"id": rng.choice(ids)},
+        "nearby": lambda: {"lat": rng.uniform(-60, 70), "lng": rng.uniform(-180, 180)},
+        "byLanguage": lambda: {"language": rng.choice(languages)},
+        "edit": lambda: {"id": rng.choice(ids), "population": rng.randint(1000, 10 ** 9)},
+    }
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "python": platform.python_version(),
+            "dataset": args.dataset,
+            "countries": len(ids),
+            "backend": args.backend,
+            "app": args.app,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "responseCache": not args.no_response_cache,
+            "seedSeconds": round(seeded, 3),
+            "startupSeconds": round(startup_seconds, 3),
+        },
+        "operations": {},
+    }
+    for name in args.operations.split(","):
+        results["operations"][name] = run_operation(
+            client, name, variables[name], args.requests, args.concurrency, args.warmup)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print("{countries} countries ({dataset}, {backend}, {app})".format(**results["meta"]))
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
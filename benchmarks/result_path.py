@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import graphene
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from cache import country_cache
+from graphene_types import CustomDictionary
+from graphql import ExecutionContext
+from service import schema, DirectFieldExecutionContext
+
+#Benchmark of the result path of a 250-row countriesQuery: the previous path building a CountryType per row with a
+#resolve_* method per field, against returning the cached rows directly, first through graphene's default resolver and
+#then through the DirectFieldExecutionContext reading the fields from the rows. The cache is seeded with synthetic
+#rows, so no database is needed.
+
+QUERY = "{ countriesQuery { id name independent status unMember currencies capital languages latlng flag maps " \
+        "population timezones continents } }"
+
+
+def synthetic_rows(count):
+    return [{
+        "id": str(ObjectId()),
+        "name": "Country {0}".format(i),
+        "independent": True,
+        "status": True,
+        "unMember": i % 2 == 0,
+        "currencies": "EUR",
+        "capital": ["Capital {0}".format(i)],
+        "languages": ["English", "French"],
+        "latlng": [float(i % 90), float(i % 180)],
+        "flag": "F",
+        "maps": {"googleMaps": "https://goo.gl/maps/{0}".format(i)},
+        "population": i * 1000,
+        "timezones": ["UTC+01:00"],
+        "continents": ["Europe"],
+    } for i in range(count)]
+
+
+class LegacyCountryType(graphene.ObjectType):
+    id = graphene.String()
+    name = graphene.String()
+    independent = graphene.Boolean()
+    status = graphene.Boolean()
+    unMember = graphene.Boolean()
+    currencies = CustomDictionary()
+    capital = graphene.List(graphene.String)
+    languages = graphene.List(graphene.String)
+    latlng = graphene.List(graphene.Float)
+    flag = graphene.String()
+    maps = CustomDictionary()
+    population = graphene.Int()
+    timezones = graphene.List(graphene.String)
+    continents = graphene.List(graphene.String)
+
+    def resolve_id(self, info): return self.id
+    def resolve_name(self, info): return self.name
+    def resolve_independent(self, info): return self.independent
+    def resolve_status(self, info): return self.status
+    def resolve_unMember(self, info): return self.unMember
+    def resolve_currencies(self, info): return self.currencies
+    def resolve_capital(self, info): return self.capital
+    def resolve_languages(self, info): return self.languages
+    def resolve_latlng(self, info): return self.latlng
+    def resolve_flag(self, info): return self.flag
+    def resolve_maps(self, info): return self.maps
+    def resolve_population(self, info): return self.population
+    def resolve_timezones(self, info): return self.timezones
+    def resolve_continents(self, info): return self.continents
+
+
+class LegacyQuery(graphene.ObjectType):
+    countriesQuery = graphene.List(LegacyCountryType)
+
+    def resolve_countriesQuery(self, info):
+        return [LegacyCountryType(**item) for item in country_cache.snapshot.get(country_cache.SNAPSHOT_KEY)]
+
+
+def measure(target_schema, context_class, iterations):
+    """
+    It returns the average latency in milliseconds and the memory allocated by one execution in KiB
+    """
+    target_schema.execute(QUERY, execution_context_class=context_class)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        target_schema.execute(QUERY, execution_context_class=context_class)
+    latency = (time.perf_counter() - started) / iterations * 1000
+    tracemalloc.start()
+    target_schema.execute(QUERY, execution_context_class=context_class)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latency, peak / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=250)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    country_cache.snapshot.set(country_cache.SNAPSHOT_KEY, synthetic_rows(args.rows))
+    print("{0:<10} {1:>12} {2:>16}".format("path", "latency (ms)", "peak alloc (KiB)"))
+    paths = (
+        ("legacy", graphene.Schema(query=LegacyQuery), ExecutionContext),
+        ("lean", schema, ExecutionContext),
+        ("direct", schema, DirectFieldExecutionContext),
+    )
+    for name, target_schema, context_class in paths:
+        latency, allocated = measure(target_schema, context_class, args.iterations)
+        print("{0:<10} {1:>12.2f} {2:>16.1f}".format(name, latency, allocated))
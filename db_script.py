@@ -1,5 +1,17 @@
-from app.utils import insert_data_into_db
+import argparse
+from app.utils import insert_data_into_db, export_snapshot, INGEST_BATCH_SIZE
 
 #Python script to import data from (https://restcountries.com/v3.1/all) into a MongoDB database.
- 
-insert_data_into_db()
\ No newline at end of file
+#Pass --file to import a JSON file saved from that endpoint instead. Running it again updates the existing countries.
+#Pass --export to write the stored countries to a snapshot file for COUNTRY_BACKEND=memory with MEMORY_SNAPSHOT_PATH.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--file', help='JSON file holding the REST API response, read instead of calling the API')
+parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help='countries written per bulk_write')
+parser.add_argument('--export', help='JSON snapshot file to write the stored countries to, instead of importing')
+args = parser.parse_args()
+
+if args.export:
+    print("Exported {0} countries to {1}".format(export_snapshot(args.export), args.export))
+else:
+    insert_data_into_db(args.file, args.batch_size)
@@ -1,3 +1,3 @@
 #!/bin/bash
 
-python app/main.py
\ No newline at end of file
+python app/server.py
\ No newline at end of file